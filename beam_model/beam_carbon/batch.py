@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division
+import numpy as np
+from beam_carbon.beam import BEAMCarbon, OUTPUT_ROWS
+
+
+BATCH_COLUMNS = ['trajectory', 'time'] + OUTPUT_ROWS
+
+
+def read_trajectories(path, chunk_size=100):
+    """Stream emissions trajectories from a file, chunk_size at a time.
+
+    A .npy file holds one trajectory per row (or a single 1-D trajectory)
+    and is memory-mapped. Any other file is read as CSV with one
+    comma-separated trajectory per line and no header; blank lines are
+    skipped.
+
+    Args:
+        :param path: Path to the input file
+        :type path: str
+        :param chunk_size: Trajectories per chunk
+        :type chunk_size: int
+    :return: Generator of (first trajectory id, list of emissions arrays)
+    """
+    if path.endswith('.npy'):
+        trajectories = np.load(path, mmap_mode='r')
+        if trajectories.ndim == 1:
+            trajectories = trajectories[np.newaxis]
+        for first in xrange(0, trajectories.shape[0], chunk_size):
+            yield first, [
+                np.array(e, dtype=float)
+                for e in trajectories[first:first + chunk_size]]
+        return
+
+    first, chunk = 0, []
+    with open(path, 'r') as f:
+        for line in f:
+            values = [v for v in line.strip().split(',') if v.strip()]
+            if not values:
+                continue
+            chunk.append(np.array([float(v) for v in values]))
+            if len(chunk) == chunk_size:
+                yield first, chunk
+                first, chunk = first + len(chunk), []
+    if chunk:
+        yield first, chunk
+
+
+def run_group(task):
+    """Run one group of equal-length trajectories as a BEAM ensemble.
+
+    :param task: (trajectory ids, (members x n) emissions, time step,
+        intervals)
+    :type task: tuple
+    :return: Long-format rows with BATCH_COLUMNS
+    :rtype: np.ndarray
+    """
+    ids, emissions, time_step, intervals = task
+    beam = BEAMCarbon(emissions[0], time_step=time_step,
+                      intervals=intervals)
+    output = beam.run_ensemble(emissions)
+    members, _, steps = output.shape
+    rows = np.empty((members, steps, len(BATCH_COLUMNS)))
+    rows[:, :, 0] = np.asarray(ids)[:, np.newaxis]
+    rows[:, :, 1] = np.arange(steps) * time_step
+    rows[:, :, 2:] = output.transpose(0, 2, 1)
+    return rows.reshape(-1, len(BATCH_COLUMNS))
+
+
+def chunk_tasks(first, chunk, time_step, intervals, pieces=1):
+    """Split a chunk into run_group tasks of equal-length trajectories,
+    each length split into up to pieces tasks.
+    """
+    lengths = {}
+    for i, e in enumerate(chunk):
+        lengths.setdefault(len(e), []).append(i)
+    tasks = []
+    for n in sorted(lengths):
+        members = lengths[n]
+        for part in np.array_split(members, min(pieces, len(members))):
+            tasks.append((first + part, np.array([chunk[i] for i in part]),
+                          time_step, intervals))
+    return tasks
+
+
+def run_batch(path, output, time_step=1, intervals=10, chunk_size=100,
+              processes=1):
+    """Run BEAM on every trajectory in an input file (see
+    read_trajectories), appending the results chunk by chunk to a CSV
+    file in long format: one row per trajectory and time, with
+    BATCH_COLUMNS as the header. Only one chunk is held in memory.
+
+    Args:
+        :param path: Path to the input file
+        :type path: str
+        :param output: Path to the output CSV file, which is overwritten
+        :type output: str
+        :param time_step: Time between emissions values in years
+        :type time_step: float
+        :param intervals: BEAM calculation intervals per time step
+        :type intervals: int
+        :param chunk_size: Trajectories read and run at a time
+        :type chunk_size: int
+        :param processes: Worker processes; 1 runs in this process and
+            None uses one per CPU
+        :type processes: int
+    :return: Number of trajectories run
+    :rtype: int
+    """
+    pool = None
+    if processes != 1:
+        import multiprocessing
+        processes = processes or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(processes)
+    fmt = ['%d'] + ['%.17g'] * (len(BATCH_COLUMNS) - 1)
+    count = 0
+    try:
+        with open(output, 'w') as f:
+            f.write(','.join(BATCH_COLUMNS) + '\n')
+            for first, chunk in read_trajectories(path, chunk_size):
+                tasks = chunk_tasks(first, chunk, time_step, intervals,
+                                    processes)
+                if pool is None:
+                    rows = np.concatenate([run_group(task) for task in tasks])
+                else:
+                    rows = np.concatenate(pool.map(run_group, tasks))
+                # Back in input order; mergesort keeps times in order
+                rows = rows[np.argsort(rows[:, 0], kind='mergesort')]
+                np.savetxt(f, rows, fmt=fmt, delimiter=',')
+                f.flush()
+                count += len(chunk)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return count
@@ -5,10 +5,29 @@ from math import floor
 import numpy as np
 import pandas as pd
 from beam_carbon.temperature import DICETemperature, LinearTemperature
+from beam_carbon import chemistry
 
 
 __version__ = '0.3'
 
+OUTPUT_ROWS = ['mass_atmosphere', 'mass_upper', 'mass_lower',
+               'temp_atmosphere', 'temp_ocean', 'phi12', 'phi22',
+               'cumulative', 'A', 'B']
+
+# Dormand-Prince 5(4) tableau for BEAMCarbon.run_adaptive: stage weights,
+# fifth-order solution weights and fifth minus fourth-order error weights
+DOPRI_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+]
+DOPRI_B = [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0]
+DOPRI_E = [71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200,
+           22 / 525, -1 / 40]
+
 
 class BEAMCarbon(object):
     """Class for computing BEAM carbon cycle from emissions input.
@@ -27,6 +46,7 @@ class BEAMCarbon(object):
             :type intervals: int
         """
         self._temperature_dependent = True
+        self._tabulated_chemistry = False
         self._intervals = intervals
         self._time_step = time_step
         self.temperature = DICETemperature(self.time_step, self.intervals, 0)
@@ -41,10 +61,14 @@ class BEAMCarbon(object):
         self._k_h = 1.23e3
         self._A = None
         self._B = None
+        self._transfer_matrix = None
         self._Alk = 767.
 
         self._initial_carbon = np.array([808.9, 725., 35641.])
         self._carbon_mass = None
+        self.checkpoint_state = None
+        self.adaptive_stats = None
+        self.exact_refreshes = None
 
         self._linear_temperature = False
 
@@ -71,14 +95,33 @@ class BEAMCarbon(object):
 
     @property
     def transfer_matrix(self):
-        """3 by 3 matrix of transfer coefficients for carbon cycle.
+        """3 by 3 matrix of transfer coefficients for carbon cycle. The
+        matrix is cached and updated in place whenever A or B (through
+        which k_h, k_1 and k_2 enter it) are set to a new value.
+        """
+        if self._transfer_matrix is None:
+            # B first: its lazy calibration can reset A
+            B = self.B
+            A = self.A
+            self._transfer_matrix = np.array([
+                -self.k_a, self.k_a * A * B, 0,
+                self.k_a, -(self.k_a * A * B) - self.k_d,
+                self.k_d / self.delta,
+                0, self.k_d, -self.k_d / self.delta,
+            ]).reshape((3, 3,))
+        return self._transfer_matrix
+
+    def update_transfer_matrix(self):
+        """Update the A and B terms of the cached transfer matrix in place.
         """
-        return np.array([
-            -self.k_a, self.k_a * self.A * self.B, 0,
-            self.k_a, -(self.k_a * self.A * self.B) - self.k_d,
-            self.k_d / self.delta,
-            0, self.k_d, -self.k_d / self.delta,
-        ]).reshape((3, 3,))
+        if self._transfer_matrix is None:
+            return
+        if self._A is None or self._B is None:
+            self._transfer_matrix = None
+            return
+        ab = self.k_a * self._A * self._B
+        self._transfer_matrix[0, 1] = ab
+        self._transfer_matrix[1, 1] = -ab - self.k_d
 
     @property
     def emissions(self):
@@ -206,7 +249,9 @@ class BEAMCarbon(object):
 
     @A.setter
     def A(self, value):
-        self._A = value
+        if value is None or value != self._A:
+            self._A = value
+            self.update_transfer_matrix()
 
     @property
     def B(self):
@@ -219,7 +264,9 @@ class BEAMCarbon(object):
 
     @B.setter
     def B(self, value):
-        self._B = value
+        if value is None or value != self._B:
+            self._B = value
+            self.update_transfer_matrix()
 
     @property
     def salinity(self):
@@ -255,75 +302,119 @@ class BEAMCarbon(object):
         else:
             raise TypeError('BEAMCarbon.temperature_dependent must be True or False.')
 
+    @property
+    def tabulated_chemistry(self):
+        """Switch for taking k_1, k_2 and k_h from a per-process lookup
+        table (see chemistry.ChemistryTable) rather than the fitted
+        formulas when recalibrating.
+        """
+        return self._tabulated_chemistry
+
+    @tabulated_chemistry.setter
+    def tabulated_chemistry(self, value):
+        if type(value) is bool:
+            self._tabulated_chemistry = value
+        else:
+            raise TypeError('BEAMCarbon.tabulated_chemistry must be True or False.')
+
     def temp_calibrate(self, to):
         """Recalibrate temperature-dependent parameters k_1, k_2, and k_h.
         """
-        self.k_1 = self.get_k1(to)
-        self.k_2 = self.get_k2(to)
-        self.k_h = self.get_kh(to)
+        if self.tabulated_chemistry:
+            self.k_1, self.k_2, self.k_h = self.get_constants(to)
+        else:
+            self.k_1 = self.get_k1(to)
+            self.k_2 = self.get_k2(to)
+            self.k_h = self.get_kh(to)
         self.A = self.get_A()
 
-    def get_B(self, h):
+    def get_constants(self, temp_ocean):
+        """k_1, k_2 and k_h at an ocean temperature, or arrays of them for
+        an array of temperatures, from the lookup table when
+        tabulated_chemistry is set and the fitted formulas otherwise.
+
+        :param temp_ocean: ocean temperature (C)
+        :type temp_ocean: float
+        :return: (k_1, k_2, k_h)
+        :rtype: tuple
+        """
+        if self.tabulated_chemistry:
+            return tuple(
+                chemistry.chemistry_table(self.salinity).lookup(temp_ocean))
+        return (self.get_k1(temp_ocean), self.get_k2(temp_ocean),
+                self.get_kh(temp_ocean, update_A=False))
+
+    def get_B(self, h, k_1=None, k_2=None):
         """Calculate B (Ratio of dissolved CO2 to total oceanic carbon),
          given H (the concentration of hydrogen ions)
 
         :param h: H, concentration of hydrogen ions [H+] (the (pH) of seawater)
         :type h: float
+        :param k_1: k_1 to use instead of this instance's
+        :param k_2: k_2 to use instead of this instance's
         :return: B, ratio of dissolved CO2 to total oceanic carbon
         :rtype: float
         """
-        return 1 / (1 + self.k_1 / h + self.k_1 * self.k_2 / h ** 2)
+        k_1 = self.k_1 if k_1 is None else k_1
+        k_2 = self.k_2 if k_2 is None else k_2
+        return 1 / (1 + k_1 / h + k_1 * k_2 / h ** 2)
 
-    def get_A(self):
+    def get_A(self, k_h=None, delta=None):
         """Calculate A based on temperature-dependent changes in k_h
 
+        :param k_h: k_h to use instead of this instance's
+        :param delta: delta to use instead of this instance's
         :return: A
         :rtype: float
         """
-        return self.k_h * self.AM / (self.OM / (self.delta + 1))
+        k_h = self.k_h if k_h is None else k_h
+        delta = self.delta if delta is None else delta
+        return k_h * self.AM / (self.OM / (delta + 1))
 
-    def get_H(self, mass_upper):
+    def get_H(self, mass_upper, k_1=None, k_2=None, Alk=None):
         """Solve for H+, the concentration of hydrogen ions
-        (the (pH) of seawater).
+        (the (pH) of seawater), as the larger root of
+        H^2 + p1 H + p2 = 0. The root is taken in closed form, avoiding
+        cancellation by computing the smaller-magnitude root from the
+        product of the roots.
 
-        :param mass_upper: Carbon mass in ocenas in GtC
+        :param mass_upper: Carbon mass in ocenas in GtC, or an array of
+            masses
         :type mass_upper: float
+        :param k_1: k_1 to use instead of this instance's
+        :param k_2: k_2 to use instead of this instance's
+        :param Alk: Alkalinity to use instead of this instance's
         :return: H
         :rtype: float
         """
-        p0 = 1
-        p1 = (self.k_1 - mass_upper * self.k_1 / self.Alk)
-        p2 = (1 - 2 * mass_upper / self.Alk) * self.k_1 * self.k_2
-        return max(np.roots([p0, p1, p2]))
-
-    def get_kh(self, temp_ocean):
+        k_1 = self.k_1 if k_1 is None else k_1
+        k_2 = self.k_2 if k_2 is None else k_2
+        Alk = self.Alk if Alk is None else Alk
+        p1 = (k_1 - mass_upper * k_1 / Alk)
+        p2 = (1 - 2 * mass_upper / Alk) * k_1 * k_2
+        q = -.5 * (p1 + np.copysign(np.sqrt(p1 ** 2 - 4 * p2), p1))
+        return np.maximum(q, p2 / q)
+
+    def get_kh(self, temp_ocean, update_A=True):
         """Calculate temperature dependent k_h
 
         :param temp_ocean: ocean temperature (C)
         :type temp_ocean: float
+        :param update_A: Whether to also set A from the new k_h
+        :type update_A: bool
         :return: k_h
         :rtype: float
         """
-        t = 283.15 + temp_ocean
-        k0 = np.exp(
-            9345.17 / t - 60.2409 + 23.3585 * np.log(t / 100.) +
-            self.salinity * (
-                .023517 - .00023656 * t + .0047036 * (t / 100.) ** 2))
-        kh = 1 / (k0 * 1.027) * 55.57
-        self.A = kh * self.AM / (self.OM / (self.delta + 1.))
+        kh = chemistry.get_kh(temp_ocean, self.salinity)
+        if update_A:
+            self.A = kh * self.AM / (self.OM / (self.delta + 1.))
         return kh
 
     def get_pk1(self, t):
-        return (
-            -13.721 + 0.031334 * t + 3235.76 / t + 1.3e-5 * self.salinity * t -
-            0.1031 * self.salinity ** 0.5)
+        return chemistry.get_pk1(t, self.salinity)
 
     def get_pk2(self, t):
-        return (
-            5371.96 + 1.671221 * t + 0.22913 * self.salinity +
-            18.3802 * np.log10(self.salinity)) - (128375.28 / t +
-            2194.30 * np.log10(t) + 8.0944e-4 * self.salinity * t +
-            5617.11 * np.log10(self.salinity) / t) + 2.136 * self.salinity / t
+        return chemistry.get_pk2(t, self.salinity)
 
     def get_k1(self, temp_ocean):
         """Calculate temperature dependent k_1
@@ -345,72 +436,504 @@ class BEAMCarbon(object):
         """
         return 10 ** -self.get_pk2(283.15 + temp_ocean)
 
-    def run(self):
+    def run(self, state=None, checkpoint=None):
+        """Run BEAM over the emissions array (see run_array).
+
+        :return: Carbon masses, temperatures and parameters at the start
+            of each timestep and after the last one, with OUTPUT_ROWS as
+            the index and times as the columns
+        :rtype: pd.DataFrame
+        """
+        return self.output_frame(self.run_array(state, checkpoint))
+
+    def output_frame(self, output):
+        """Wrap run_array output in a DataFrame.
+
+        :param output: Output of run_array
+        :type output: np.ndarray
+        :rtype: pd.DataFrame
+        """
+        return pd.DataFrame(
+            output, index=OUTPUT_ROWS,
+            columns=np.arange(output.shape[1]) * self.time_step)
+
+    def run_array(self, state=None, checkpoint=None):
+        """Run BEAM over the emissions array.
+
+        Args:
+            :param state: Model state at the start of a timestep, as
+                recorded by a previous run with checkpoint. The run
+                resumes from that timestep, taking the earlier output
+                columns from the state.
+            :type state: dict
+            :param checkpoint: Timestep at whose start to record the
+                model state in checkpoint_state
+            :type checkpoint: int
+        :return: (10 x n + 1) array of carbon masses, temperatures and
+            parameters (OUTPUT_ROWS) at the start of each timestep and
+            after the last one
+        :rtype: np.ndarray
+        """
         N = self.n * self.intervals
-        self.carbon_mass = self.initial_carbon.copy()
-        total_carbon = 0
         emissions = np.zeros(3)
-        temp_atmosphere, temp_ocean = self.temperature.initial_temp
+        output, start, total_carbon, temp_atmosphere, temp_ocean = \
+            self._start_run(state, checkpoint)
 
-        output = np.tile(np.concatenate((
-            self.initial_carbon,
-            self.temperature.initial_temp,
-            np.array([
-                self.transfer_matrix[0][1], self.transfer_matrix[1][1]]),
-            np.zeros(3),
-        )).reshape((10, 1)).copy(), (self.n + 1, ))
-        output = pd.DataFrame(
-            output,
-            index=['mass_atmosphere', 'mass_upper', 'mass_lower',
-                   'temp_atmosphere', 'temp_ocean', 'phi12', 'phi22',
-                   'cumulative', 'A', 'B'],
-            columns=np.arange(self.n + 1) * self.time_step,
-        )
+        # The substep loop updates these arrays in place; the transfer
+        # matrix is itself updated in place as B changes.
+        mass = self.carbon_mass
+        transfer_matrix = self.transfer_matrix
+        scaled_mass = np.empty(3)
+        flux = np.empty(3)
+        annual_emissions = np.asarray(self.emissions, dtype=float)
 
-        for i in xrange(N):
+        for i in xrange(start * self.intervals, N):
 
             _i = int(floor(i / self.intervals)) # time_step
 
             if i % self.intervals == 0 and self.temperature_dependent:
                 self.temp_calibrate(temp_ocean)
 
-            h = self.get_H(self.carbon_mass[1])
+            h = self.get_H(mass[1])
             self.B = self.get_B(h)
 
-            emissions[0] = self.emissions[_i] * self.time_step / self.intervals
+            emissions[0] = annual_emissions[_i] * self.time_step / self.intervals
             total_carbon += emissions[0]
 
-            self.carbon_mass += (
-                (self.transfer_matrix *
-                 np.divide(self.carbon_mass, self.intervals)).sum(axis=1) +
-                emissions)
+            np.divide(mass, self.intervals, out=scaled_mass)
+            np.dot(transfer_matrix, scaled_mass, out=flux)
+            flux += emissions
+            mass += flux
 
             if (i + 1) % self.intervals == 0:
 
-                emissions[0] = self.emissions[_i] * self.time_step
+                emissions[0] = annual_emissions[_i] * self.time_step
                 total_carbon += emissions[0]
 
-                ta = temp_atmosphere
-                temp_atmosphere = self.temperature.temp_atmosphere(
-                    index=_i, temp_atmosphere=ta,
-                    temp_ocean=temp_ocean, mass_atmosphere=self.carbon_mass[0],
-                    carbon=total_carbon, initial_carbon=self.initial_carbon,
-                    phi11=self.transfer_matrix[0][0],
-                    phi21=self.transfer_matrix[1][0])
-                temp_ocean = self.temperature.temp_ocean(
-                    ta, temp_ocean)
-
-                output.iloc[:, _i + 1] = (
-                    np.concatenate((self.carbon_mass.copy(),
-                                    np.array([temp_atmosphere, temp_ocean]),
-                                    np.array([self.transfer_matrix[0][1],
-                                              self.transfer_matrix[1][1],
-                                              total_carbon,
-                                              self.A, self.B]))))
+                temp_atmosphere, temp_ocean = self._end_timestep(
+                    _i, output, total_carbon, temp_atmosphere, temp_ocean,
+                    checkpoint)
+
+        return output
+
+    def run_adaptive(self, rtol=1e-6, atol=1e-3, state=None,
+                     checkpoint=None):
+        """Run BEAM with an adaptive Dormand-Prince 5(4) integrator in
+        place of the fixed intervals. The carbon ODE is the one the
+        substeps approximate by forward Euler, with B following the upper
+        ocean mass continuously. Steps may span only part of a timestep,
+        so k_1, k_2 and k_h are still recalibrated at each timestep
+        boundary and emissions stay constant within a timestep; the step
+        size carries across boundaries, so quiet periods take few steps.
+        Steps taken, steps rejected and the summed local error estimate
+        (GtC) for each timestep are left in adaptive_stats.
+
+        Args:
+            :param rtol: Relative tolerance on carbon masses
+            :type rtol: float
+            :param atol: Absolute tolerance on carbon masses in GtC
+            :type atol: float
+            :param state: As for run_array
+            :type state: dict
+            :param checkpoint: As for run_array
+            :type checkpoint: int
+        :return: As for run_array
+        :rtype: np.ndarray
+        """
+        output, start, total_carbon, temp_atmosphere, temp_ocean = \
+            self._start_run(state, checkpoint)
+        mass = self.carbon_mass
+        annual_emissions = np.asarray(self.emissions, dtype=float)
+        steps = np.zeros(self.n, dtype=int)
+        rejected = np.zeros(self.n, dtype=int)
+        error = np.zeros(self.n)
+        h = .1 if state is None else state.get('step_size', .1)
+
+        for _i in xrange(start, self.n):
+
+            if self.temperature_dependent:
+                self.temp_calibrate(temp_ocean)
+            emitted = annual_emissions[_i] * self.time_step
+            k_a, k_d, k_l = self.k_a, self.k_d, self.k_d / self.delta
+            A = self.A
+
+            def rate(m):
+                ab = k_a * A * self.get_B(self.get_H(m[1]))
+                return np.array([
+                    -k_a * m[0] + ab * m[1] + emitted,
+                    k_a * m[0] - (ab + k_d) * m[1] + k_l * m[2],
+                    k_d * m[1] - k_l * m[2]])
+
+            # Time runs over the timestep from 0 to 1, as in the substeps
+            t = 0.
+            k = [rate(mass)]
+            while t < 1.:
+                h = min(h, 1. - t)
+                for a in DOPRI_A[1:]:
+                    k.append(rate(mass + h * np.dot(a, k)))
+                proposal = mass + h * np.dot(DOPRI_B[:6], k)
+                k.append(rate(proposal))
+                local_error = h * np.dot(DOPRI_E, k)
+                scale = atol + rtol * np.maximum(np.abs(mass),
+                                                 np.abs(proposal))
+                norm = np.sqrt(np.mean((local_error / scale) ** 2))
+                if norm <= 1.:
+                    t = 1. if h >= 1. - t else t + h
+                    mass[:] = proposal
+                    k = k[-1:]
+                    steps[_i] += 1
+                    error[_i] += np.abs(local_error).max()
+                else:
+                    k = k[:1]
+                    rejected[_i] += 1
+                h *= min(5., max(.2, .9 * norm ** -.2)) if norm > 0 else 5.
+
+            self.B = self.get_B(self.get_H(mass[1]))
+            # As in run, a timestep's emissions are counted once through
+            # its substeps and again at its end
+            total_carbon += 2 * emitted
+
+            temp_atmosphere, temp_ocean = self._end_timestep(
+                _i, output, total_carbon, temp_atmosphere, temp_ocean,
+                checkpoint)
+            if checkpoint == _i + 1:
+                self.checkpoint_state['step_size'] = h
+
+        self.adaptive_stats = {
+            'steps': steps,
+            'rejected': rejected,
+            'error': error,
+        }
+        return output
+
+    def run_exact(self, b_tolerance=1e-4, state=None, checkpoint=None):
+        """Run BEAM over the emissions array with exponential integrator
+        steps in place of the forward-Euler substeps. Each of the
+        intervals advances by m <- m + (int_0^h exp(J s) ds) f(m), where
+        f(m) = T m + e is the substep rate and J its Jacobian. For fixed
+        A and B this is the exact solution of the linear 3-box system;
+        J also carries the change of B with the upper ocean mass (the
+        buffer factor), which keeps large intervals stable and accurate.
+        The matrix exponential is cached and only recomputed when A
+        changes or the effective B in J moves more than b_tolerance
+        (relative) from the value it was computed for; the count of
+        recomputations is left in exact_refreshes.
+
+        Args:
+            :param b_tolerance: Relative change in the effective B that
+                triggers a new matrix exponential
+            :type b_tolerance: float
+            :param state: As for run_array
+            :type state: dict
+            :param checkpoint: As for run_array
+            :type checkpoint: int
+        :return: As for run_array
+        :rtype: np.ndarray
+        """
+        output, start, total_carbon, temp_atmosphere, temp_ocean = \
+            self._start_run(state, checkpoint)
+        mass = self.carbon_mass
+        transfer_matrix = self.transfer_matrix
+        annual_emissions = np.asarray(self.emissions, dtype=float)
+        h = 1 / self.intervals
+        augmented = np.zeros((6, 6))
+        augmented[:3, 3:] = np.eye(3) * h
+        integral = None
+        cached_A = cached_B = None
+        rate = np.empty(3)
+        self.exact_refreshes = 0
+
+        for i in xrange(start * self.intervals, self.n * self.intervals):
+
+            _i = int(floor(i / self.intervals)) # time_step
+
+            if i % self.intervals == 0:
+                if self.temperature_dependent:
+                    self.temp_calibrate(temp_ocean)
+                emitted = annual_emissions[_i] * self.time_step
+
+            upper = mass[1]
+            self.B = self.get_B(self.get_H(upper))
+            step = upper * 1e-7
+            effective_B = self.B + upper * (
+                self.get_B(self.get_H(upper + step)) - self.B) / step
+            if (integral is None or self.A != cached_A or
+                    abs(effective_B - cached_B) > b_tolerance * abs(cached_B)):
+                cached_A = self.A
+                cached_B = effective_B
+                exchange = self.k_a * cached_A * effective_B
+                augmented[:3, :3] = transfer_matrix * h
+                augmented[0, 1] = exchange * h
+                augmented[1, 1] = -(exchange + self.k_d) * h
+                integral = expm(augmented)[:3, 3:].copy()
+                self.exact_refreshes += 1
+
+            np.dot(transfer_matrix, mass, out=rate)
+            rate[0] += emitted
+            mass += integral.dot(rate)
+            total_carbon += emitted * h
+
+            if (i + 1) % self.intervals == 0:
+
+                total_carbon += emitted
+
+                temp_atmosphere, temp_ocean = self._end_timestep(
+                    _i, output, total_carbon, temp_atmosphere, temp_ocean,
+                    checkpoint)
+
+        return output
+
+    def _start_run(self, state, checkpoint):
+        """Initial or restored run state (see run_array).
+
+        :return: (output, first timestep, total carbon, atmospheric
+            temperature, ocean temperature)
+        :rtype: tuple
+        """
+        self.carbon_mass = self.initial_carbon.copy()
+        total_carbon = 0
+        temp_atmosphere, temp_ocean = self.temperature.initial_temp
+        self.checkpoint_state = None
+
+        output = np.empty((len(OUTPUT_ROWS), self.n + 1))
+        output[:, 0] = np.concatenate((
+            self.initial_carbon,
+            self.temperature.initial_temp,
+            np.array([
+                self.transfer_matrix[0][1], self.transfer_matrix[1][1]]),
+            np.zeros(3),
+        ))
+
+        start = 0
+        if state is not None:
+            start = state['index']
+            if not 0 <= start <= self.n:
+                raise ValueError('BEAMCarbon state is outside the emissions array.')
+            self.carbon_mass = state['carbon_mass'].copy()
+            total_carbon = state['total_carbon']
+            temp_atmosphere = state['temp_atmosphere']
+            temp_ocean = state['temp_ocean']
+            self.k_1, self.k_2, self.k_h = state['k_1'], state['k_2'], state['k_h']
+            self.A, self.B = state['A'], state['B']
+            output[:, :start + 1] = state['output']
+        if checkpoint == start:
+            self.checkpoint_state = self.get_state(
+                start, output, total_carbon, temp_atmosphere, temp_ocean)
+        return output, start, total_carbon, temp_atmosphere, temp_ocean
+
+    def _end_timestep(self, _i, output, total_carbon, temp_atmosphere,
+                      temp_ocean, checkpoint):
+        """Update temperatures at the end of timestep _i and record the
+        output column (and checkpoint state) that follows it.
+
+        :return: (atmospheric temperature, ocean temperature)
+        :rtype: tuple
+        """
+        transfer_matrix = self.transfer_matrix
+        ta = temp_atmosphere
+        temp_atmosphere = self.temperature.temp_atmosphere(
+            index=_i, temp_atmosphere=ta,
+            temp_ocean=temp_ocean, mass_atmosphere=self.carbon_mass[0],
+            carbon=total_carbon, initial_carbon=self.initial_carbon,
+            phi11=transfer_matrix[0, 0],
+            phi21=transfer_matrix[1, 0])
+        temp_ocean = self.temperature.temp_ocean(
+            ta, temp_ocean)
+
+        column = output[:, _i + 1]
+        column[:3] = self.carbon_mass
+        column[3] = temp_atmosphere
+        column[4] = temp_ocean
+        column[5] = transfer_matrix[0, 1]
+        column[6] = transfer_matrix[1, 1]
+        column[7] = total_carbon
+        column[8] = self.A
+        column[9] = self.B
+
+        if checkpoint == _i + 1:
+            self.checkpoint_state = self.get_state(
+                _i + 1, output, total_carbon, temp_atmosphere,
+                temp_ocean)
+        return temp_atmosphere, temp_ocean
+
+    def get_state(self, index, output, total_carbon, temp_atmosphere,
+                  temp_ocean):
+        """Model state at the start of a timestep, for resuming a run.
+
+        :param index: Timestep
+        :type index: int
+        :param output: Run output filled in up to index
+        :type output: np.ndarray
+        :return: State to pass to run
+        :rtype: dict
+        """
+        return {
+            'index': index,
+            'carbon_mass': self.carbon_mass.copy(),
+            'total_carbon': total_carbon,
+            'temp_atmosphere': temp_atmosphere,
+            'temp_ocean': temp_ocean,
+            'k_1': self.k_1,
+            'k_2': self.k_2,
+            'k_h': self.k_h,
+            'A': self.A,
+            'B': self.B,
+            'output': output[:, :index + 1].copy(),
+        }
+
+    def run_ensemble(self, emissions=None, initial_carbon=None, k_a=None,
+                     k_d=None, delta=None, Alk=None,
+                     temperature_dependent=None):
+        """Run BEAM for many members at once, with carbon masses held as a
+        (members x 3) array and H+, B and the temperature calibration
+        solved for all members together. Each argument defaults to this
+        instance's value and may instead give one value per member; the
+        number of members is set by broadcasting them. All members share
+        this instance's time step, intervals and temperature model.
+
+        Args:
+            :param emissions: (members x n) or (n,) annual emissions in GtC
+            :type emissions: np.ndarray
+            :param initial_carbon: (members x 3) or (3,) initial carbon in
+                the atmosphere, upper and lower oceans in GtC
+            :type initial_carbon: np.ndarray
+            :param k_a: Time constant k_{a}
+            :param k_d: Time constant k_{d}
+            :param delta: Ratio of lower ocean to upper ocean
+            :param Alk: Alkalinity in GtC
+            :param temperature_dependent: Whether to recalibrate k_1, k_2
+                and k_h from the ocean temperature each timestep
+        :return: (members x 10 x n + 1) array with rows as in OUTPUT_ROWS
+        :rtype: np.ndarray
+        """
+        # Settle the lazily calibrated parameters as run() would
+        transfer_matrix = self.transfer_matrix
+        emissions = np.atleast_2d(np.asarray(
+            self.emissions if emissions is None else emissions, dtype=float))
+        initial_carbon = np.atleast_2d(np.asarray(
+            self.initial_carbon if initial_carbon is None else initial_carbon,
+            dtype=float))
+        k_a, k_d, delta, Alk, temperature_dependent = [
+            np.asarray(default if value is None else value)
+            for value, default in [
+                (k_a, self.k_a), (k_d, self.k_d), (delta, self.delta),
+                (Alk, self.Alk),
+                (temperature_dependent, self.temperature_dependent)]]
+        members = np.broadcast(emissions[:, 0], initial_carbon[:, 0], k_a, k_d,
+                               delta, Alk, temperature_dependent).shape[0]
+
+        def per_member(value):
+            return np.array(np.broadcast_to(value, (members,)), dtype=float)
+
+        k_a, k_d, delta, Alk = [per_member(v) for v in [k_a, k_d, delta, Alk]]
+        temperature_dependent = np.broadcast_to(
+            temperature_dependent, (members,)).astype(bool)
+        emissions = np.broadcast_to(emissions, (members, emissions.shape[1]))
+        initial_carbon = np.broadcast_to(initial_carbon, (members, 3))
+        n = emissions.shape[1]
+        N = n * self.intervals
+
+        k_1 = per_member(self.k_1)
+        k_2 = per_member(self.k_2)
+        k_h = per_member(self.k_h)
+        A = self.get_A(k_h, delta)
+        B = self.get_B(self.get_H(initial_carbon[:, 1], k_1, k_2, Alk),
+                       k_1, k_2)
+        mass = initial_carbon.copy()
+        total_carbon = np.zeros(members)
+        step_emissions = np.empty(members)
+        flux = np.empty((members, 3))
+        temp_atmosphere, temp_ocean = [
+            per_member(t) for t in self.temperature.initial_temp]
+
+        output = np.empty((members, len(OUTPUT_ROWS), n + 1))
+        output[:, :3, 0] = initial_carbon
+        output[:, 3, 0] = temp_atmosphere
+        output[:, 4, 0] = temp_ocean
+        output[:, 5, 0] = k_a * A * B
+        output[:, 6, 0] = -(k_a * A * B) - k_d
+        output[:, 7:, 0] = 0.
+
+        temperature_n = self.temperature.n
+        self.temperature.n = n
+        try:
+            for i in xrange(N):
+
+                _i = int(floor(i / self.intervals)) # time_step
+
+                if i % self.intervals == 0 and temperature_dependent.any():
+                    calibrated = self.get_constants(temp_ocean)
+                    k_1 = np.where(temperature_dependent, calibrated[0], k_1)
+                    k_2 = np.where(temperature_dependent, calibrated[1], k_2)
+                    k_h = np.where(temperature_dependent, calibrated[2], k_h)
+                    A = self.get_A(k_h, delta)
+
+                B = self.get_B(self.get_H(mass[:, 1], k_1, k_2, Alk), k_1, k_2)
+                kab = k_a * A * B
+
+                np.multiply(emissions[:, _i], self.time_step / self.intervals,
+                            out=step_emissions)
+                total_carbon += step_emissions
+
+                flux[:, 0] = -k_a * mass[:, 0] + kab * mass[:, 1]
+                flux[:, 1] = (k_a * mass[:, 0] - (kab + k_d) * mass[:, 1] +
+                              k_d / delta * mass[:, 2])
+                flux[:, 2] = k_d * mass[:, 1] - k_d / delta * mass[:, 2]
+                flux /= self.intervals
+                flux[:, 0] += step_emissions
+                mass += flux
+
+                if (i + 1) % self.intervals == 0:
+
+                    total_carbon += emissions[:, _i] * self.time_step
+
+                    ta = temp_atmosphere
+                    temp_atmosphere = self.temperature.temp_atmosphere(
+                        index=_i, temp_atmosphere=ta,
+                        temp_ocean=temp_ocean, mass_atmosphere=mass[:, 0],
+                        carbon=total_carbon, initial_carbon=initial_carbon,
+                        phi11=-k_a, phi21=k_a)
+                    temp_ocean = self.temperature.temp_ocean(ta, temp_ocean)
+
+                    column = output[:, :, _i + 1]
+                    column[:, :3] = mass
+                    column[:, 3] = temp_atmosphere
+                    column[:, 4] = temp_ocean
+                    column[:, 5] = kab
+                    column[:, 6] = -kab - k_d
+                    column[:, 7] = total_carbon
+                    column[:, 8] = A
+                    column[:, 9] = B
+        finally:
+            self.temperature.n = temperature_n
 
         return output
 
 
+def expm(matrix, terms=18):
+    """Matrix exponential by scaling and squaring of a Taylor series.
+
+    :param matrix: Square matrix
+    :type matrix: np.ndarray
+    :param terms: Taylor terms, applied once the matrix is scaled to a
+        norm of at most 1/2
+    :type terms: int
+    :return: exp(matrix)
+    :rtype: np.ndarray
+    """
+    norm = np.abs(matrix).sum(axis=1).max()
+    squarings = int(np.ceil(np.log2(norm / .5))) if norm > .5 else 0
+    scaled = matrix / 2. ** squarings
+    result = np.eye(matrix.shape[0])
+    term = np.eye(matrix.shape[0])
+    for k in xrange(1, terms + 1):
+        term = term.dot(scaled) / k
+        result += term
+    for _ in xrange(squarings):
+        result = result.dot(result)
+    return result
+
+
 def main():
     def create_args():
         import argparse
@@ -423,7 +946,8 @@ def main():
             help='Comma separated values to use as emissions input.')
         input_group.add_argument(
             '-c', '--input', '--csv', type=str,
-            help='Path to CSV file to use as input.')
+            help='Path to a CSV file with one emissions trajectory per '
+                 'line, or a .npy file with one per row, to run as a batch.')
         parser.add_argument(
             '-t', '--timestep', type=float, default=1,
             help='Time step for input values in years. Default is 1.')
@@ -433,6 +957,14 @@ def main():
         parser.add_argument(
             '-o', '--output', type=str, default='beam_output.csv',
             help='Write values to CSV file instead of stdout')
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Trajectories read and run at a time in a batch. '
+                 'Default is 100.')
+        parser.add_argument(
+            '-p', '--processes', type=int, default=1,
+            help='Worker processes for a batch; 0 uses one per CPU. '
+                 'Default is 1.')
 
         return parser.parse_args()
 
@@ -458,9 +990,9 @@ def main():
         if args.emissions else None
 
     if args.input:
-        with open(args.input, 'r') as f:
-            for line in f:
-                write_beam(run_beam(line.split(',')), csv=csv)
+        from beam_carbon.batch import run_batch
+        run_batch(args.input, csv or 'beam_output.csv', args.timestep,
+                  args.intervals, args.chunk_size, args.processes or None)
     else:
         write_beam(run_beam(emissions), csv=csv)
 
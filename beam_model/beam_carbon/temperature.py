@@ -10,6 +10,9 @@ class Temperature(object):
         self.time_step = time_step
         self.periods = periods
         self.n = n
+        self._forcing_ghg = None
+        self._forcing_ghg_key = None
+        self._forcing_ghg_supplied = None
 
     @property
     def initial_temp(self):
@@ -51,11 +54,41 @@ class Temperature(object):
     def forcing_ghg(self):
         """F_EX, Exogenous forcing for other greenhouse gases
 
+        Built once and rebuilt only when n, time_step or the 2000 and 2100
+        forcing values change. An array assigned to forcing_ghg is used
+        as given instead; assign None to go back to the DICE ramp.
+
         Returns:
             :return: Array of forcing values
             :rtype: np.ndarray
 
         """
+        if self._forcing_ghg_supplied is not None:
+            return self._forcing_ghg_supplied
+        key = (self.n, self.time_step, self.forcing_ghg_2000,
+               self.forcing_ghg_2100)
+        if key != self._forcing_ghg_key:
+            self._forcing_ghg = self.forcing_ghg_ramp()
+            self._forcing_ghg_key = key
+        return self._forcing_ghg
+
+    @forcing_ghg.setter
+    def forcing_ghg(self, value):
+        if value is not None:
+            value = np.asarray(value, dtype=float)
+            if value.ndim != 1:
+                raise ValueError(
+                    'Temperature.forcing_ghg must be a 1-D array.')
+        self._forcing_ghg_supplied = value
+
+    def forcing_ghg_ramp(self):
+        """DICE2010 exogenous forcing: a linear ramp from the 2000 to the
+        2100 value over 100 years, then constant
+
+        Returns:
+            :return: Array of n forcing values
+            :rtype: np.ndarray
+        """
         _n = int(floor(100 / self.time_step))
         a = self.forcing_ghg_2000 + (1. / _n) * (
                 self.forcing_ghg_2100 - self.forcing_ghg_2000
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
+import numpy as np
+
 sys.path.insert(0, os.path.abspath('..'))
+from beam_carbon.batch import run_batch
 from beam_carbon.beam import BEAMCarbon
+from beam_carbon.chemistry import chemistry_table
 
 
 class BEAMCarbonTest(unittest.TestCase):
@@ -19,6 +25,152 @@ class BEAMCarbonTest(unittest.TestCase):
         p = self.fixture.n
         self.failUnlessEqual(100, p)
 
+    def test_run_resumes_from_checkpoint(self):
+        self.fixture.emissions = np.linspace(8., 20., 30)
+        full = self.fixture.run(checkpoint=12)
+        state = self.fixture.checkpoint_state
+        self.failUnlessEqual(12, state['index'])
+        resumed = self.fixture.run(state=state)
+        np.testing.assert_allclose(resumed.values, full.values, rtol=1e-12)
+
+    def test_get_H_matches_polynomial_roots(self):
+        beam = self.fixture
+        masses = np.linspace(500., 2000., 50)
+        expected = np.array([max(np.roots([
+            1, beam.k_1 - m * beam.k_1 / beam.Alk,
+            (1 - 2 * m / beam.Alk) * beam.k_1 * beam.k_2])) for m in masses])
+        np.testing.assert_allclose(
+            [beam.get_H(m) for m in masses], expected, rtol=1e-13)
+        np.testing.assert_allclose(beam.get_H(masses), expected, rtol=1e-13)
+
+    def test_run_matches_polynomial_roots(self):
+        emissions = np.linspace(8., 20., 30)
+        self.fixture.emissions = emissions
+        output = self.fixture.run()
+
+        reference = RootsBEAMCarbon()
+        reference.emissions = emissions
+        np.testing.assert_allclose(
+            output.values, reference.run().values, rtol=1e-10)
+
+    def test_transfer_matrix_follows_A_and_B(self):
+        beam = self.fixture
+        matrix = beam.transfer_matrix
+        beam.A = beam.A * 2.
+        beam.B = beam.B / 3.
+        self.assertIs(matrix, beam.transfer_matrix)
+        self.assertAlmostEqual(
+            beam.k_a * beam.A * beam.B, beam.transfer_matrix[0, 1])
+        self.assertAlmostEqual(
+            -beam.k_a * beam.A * beam.B - beam.k_d, beam.transfer_matrix[1, 1])
+
+    def test_run_ensemble_matches_single_runs(self):
+        emissions = np.linspace(8., 20., 30)
+        members = [
+            (767., True, [808.9, 725., 35641.], emissions),
+            (700., False, [596., 713., 35625.], emissions * .5),
+        ]
+        self.fixture.emissions = emissions
+        ensemble = self.fixture.run_ensemble(
+            emissions=[e for _, _, _, e in members],
+            Alk=[alk for alk, _, _, _ in members],
+            temperature_dependent=[td for _, td, _, _ in members],
+            initial_carbon=[c for _, _, c, _ in members])
+        self.failUnlessEqual((2, 10, 31), ensemble.shape)
+        for output, (alk, td, carbon, e) in zip(ensemble, members):
+            beam = BEAMCarbon()
+            beam.emissions = e
+            beam.Alk = alk
+            beam.temperature_dependent = td
+            beam.initial_carbon = np.array(carbon)
+            np.testing.assert_allclose(output, beam.run_array(), rtol=1e-10)
+
+    def test_run_adaptive_matches_fine_substeps(self):
+        emissions = np.concatenate((np.linspace(8., 30., 20), np.zeros(10)))
+        self.fixture.emissions = emissions
+        output = self.fixture.run_adaptive(rtol=1e-9, atol=1e-6)
+        stats = self.fixture.adaptive_stats
+        self.failUnlessEqual(30, len(stats['steps']))
+        self.assertTrue((stats['steps'] > 0).all())
+
+        fine = BEAMCarbon(emissions, intervals=2000)
+        np.testing.assert_allclose(output[:3], fine.run_array()[:3], rtol=1e-5)
+
+    def test_run_exact_matches_adaptive(self):
+        emissions = np.concatenate((np.linspace(8., 30., 20), np.zeros(10)))
+        reference = BEAMCarbon(emissions).run_adaptive(rtol=1e-9, atol=1e-6)
+        beam = BEAMCarbon(emissions, intervals=2)
+        output = beam.run_exact()
+        self.assertTrue(0 < beam.exact_refreshes <= 60)
+        np.testing.assert_allclose(output[:3], reference[:3], rtol=1e-5)
+
+    def test_tabulated_chemistry_matches_formulas(self):
+        table = chemistry_table(self.fixture.salinity)
+        self.assertLess(table.max_error, 3e-8)
+        temps = np.array([-20., -3.21, 0., 0.0068, 4.5, 39.999, 55.])
+        expected = np.array([
+            [self.fixture.get_k1(t), self.fixture.get_k2(t),
+             self.fixture.get_kh(t, update_A=False)] for t in temps]).T
+        np.testing.assert_allclose(table.lookup(temps), expected, rtol=3e-8)
+        np.testing.assert_allclose(
+            [table.lookup(t) for t in temps], expected.T, rtol=3e-8)
+
+        self.fixture.tabulated_chemistry = True
+        self.fixture.temp_calibrate(1.5)
+        self.assertAlmostEqual(
+            self.fixture.k_h / self.fixture.get_kh(1.5, update_A=False), 1.)
+
+    def test_forcing_ghg_follows_settings(self):
+        temperature = self.fixture.temperature
+        forcing = temperature.forcing_ghg
+        self.assertIs(temperature.forcing_ghg, forcing)
+        self.assertEqual(len(forcing), temperature.n)
+
+        temperature.n = 150
+        self.assertEqual(len(temperature.forcing_ghg), 150)
+        self.assertEqual(temperature.forcing_ghg[-1],
+                         temperature.forcing_ghg_2100)
+
+        temperature.time_step = temperature.time_step / 2.
+        np.testing.assert_array_equal(temperature.forcing_ghg,
+                                      temperature.forcing_ghg_ramp())
+
+        temperature.forcing_ghg = np.ones(temperature.n)
+        self.assertEqual(temperature.forcing(0, temperature.mass_pi), 1.)
+        temperature.forcing_ghg = None
+        self.assertEqual(temperature.forcing(0, temperature.mass_pi),
+                         temperature.forcing_ghg_2000)
+
+    def test_run_batch_appends_each_trajectory(self):
+        trajectories = [np.linspace(8., 20., 12), np.linspace(5., 9., 7),
+                        np.linspace(20., 8., 12)]
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'emissions.csv')
+            with open(path, 'w') as f:
+                for e in trajectories:
+                    f.write(','.join(repr(v) for v in e) + '\n')
+            output = os.path.join(directory, 'output.csv')
+            self.failUnlessEqual(3, run_batch(path, output, chunk_size=2))
+            rows = np.genfromtxt(output, delimiter=',', skip_header=1)
+        finally:
+            shutil.rmtree(directory)
+        for i, e in enumerate(trajectories):
+            members = rows[rows[:, 0] == i]
+            np.testing.assert_array_equal(members[:, 1], np.arange(len(e) + 1))
+            np.testing.assert_allclose(
+                members[:, 2:].T, BEAMCarbon(e).run_array(), rtol=1e-10)
+
+
+class RootsBEAMCarbon(BEAMCarbon):
+    """BEAMCarbon solving for H+ with np.roots, as it used to.
+    """
+    def get_H(self, mass_upper):
+        p0 = 1
+        p1 = (self.k_1 - mass_upper * self.k_1 / self.Alk)
+        p2 = (1 - 2 * mass_upper / self.Alk) * self.k_1 * self.k_2
+        return max(np.roots([p0, p1, p2]))
+
 
 if __name__ == '__main__':
     unittest.main()
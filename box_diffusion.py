@@ -0,0 +1,164 @@
+import pandas as pd
+import numpy as np
+from constants import *
+from heat_diffusion import solve_tridiagonal
+
+#Model Variables (Oeschger et al, 1975)
+MIXED_LAYER_DEPTH = 75.         #m
+DEEP_OCEAN_DEPTH = 3725.        #m below the mixed layer
+OCEAN_AREA = 3.62e14            #m^2
+DIC_CONCENTRATION = 2.0         #Pre-industrial dissolved inorganic carbon, mol m^-3
+
+#Model Constants
+AIR_SEA_EXCHANGE = 1 / 7.7      #Gross atmosphere to mixed layer exchange, per year
+BUFFER_FACTOR = 10.             #Revelle factor of the mixed layer
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+#Deep ocean eddy diffusivity by mixing preset, cm^2 s^-1
+MIXING_DIFFUSIVITY = {
+    'slow': 0.8,
+    'probable': 1.26,
+    'fast': 2.0,
+}
+
+#Pre-industrial carbon, PgC: atmosphere, and per metre of ocean depth
+ATMOSPHERE_PG_1750 = CO2_PPM_1750 * 1e-6 * MOLES_IN_ATMOSPHERE / PGC_TO_MOL
+OCEAN_PG_PER_M = DIC_CONCENTRATION * OCEAN_AREA / PGC_TO_MOL
+
+#Step operators by (dt, dz, mixing, theta)
+_operator_cache = {}
+
+
+def box_diffusion_model(emissions, dt, dz, mixing = 'probable', theta = 0.5):
+    """
+    Ocean box diffusion carbon cycle of Oeschger et al (1975): an
+    atmosphere exchanging CO2 with a well-mixed surface layer, buffered
+    by the Revelle factor, above a deep ocean of dz-thick layers mixed
+    by eddy diffusion ('fast', 'slow' or 'probable'). Carbon is tracked
+    as the perturbation from a pre-industrial equilibrium, starting at
+    the first RCP concentration.
+
+    Returns a DataFrame of co2ppm and the carbon added to the atmosphere,
+    mixed layer and deep ocean (PgC) after each timestep's emissions.
+    """
+    co2_0 = emissions['rcp_co2_ppm'].values[0]
+    results = box_diffusion_ensemble(
+        emissions['co2_pg'].values, dt, dz, mixing, co2_0, theta)
+    return pd.DataFrame({
+        'year': emissions['year'].values,
+        'co2ppm': results['co2ppm'],
+        'c_atm_pg': results['c_atm_pg'],
+        'c_mixed_pg': results['c_mixed_pg'],
+        'c_deep_pg': results['c_deep_pg'],
+    }, columns=['year', 'co2ppm', 'c_atm_pg', 'c_mixed_pg', 'c_deep_pg'],
+       index=emissions.index)
+
+
+def box_diffusion_ensemble(co2_pg, dt, dz, mixing = 'probable',
+                           co2_0 = CO2_PPM_1750, theta = 0.5):
+    """
+    Box diffusion model for many members at once. co2_pg holds CO2
+    emissions per timestep (Pg CO2) with time along the last axis and
+    members along any leading axes; mixing and co2_0 are single values
+    or one per member. All ocean columns are advanced together as a
+    (members x layers) array. Returns a dict of co2ppm, c_atm_pg,
+    c_mixed_pg and c_deep_pg arrays shaped like the members by time.
+    """
+    co2_pg = np.asarray(co2_pg, dtype=float)
+    co2_0 = np.asarray(co2_0, dtype=float)
+    mixing = np.asarray(mixing)
+    shape = np.broadcast(co2_pg[..., 0], mixing, co2_0).shape
+    steps = co2_pg.shape[-1]
+    pulses = np.broadcast_to(
+        co2_pg / C_TO_CO2, shape + (steps,)).reshape((-1, steps))
+    members = pulses.shape[0]
+
+    presets, member_mixing = np.unique(
+        np.broadcast_to(mixing, shape).ravel(), return_inverse=True)
+    operators = [box_operator(dt, dz, preset, theta) for preset in presets]
+    gain = np.array([operator[1] for operator in operators])[member_mixing]
+    shared = len(operators) == 1
+    if shared:
+        propagator_t = operators[0][0].T
+    else:
+        propagator = np.array(
+            [operator[0] for operator in operators])[member_mixing]
+
+    carbon = np.zeros((members, gain.shape[1]))
+    c_atm = np.empty((members, steps))
+    c_mixed = np.empty((members, steps))
+    c_deep = np.empty((members, steps))
+    for t in range(steps):
+        if shared:
+            carbon = carbon.dot(propagator_t)
+        else:
+            carbon = np.einsum('mij,mj->mi', propagator, carbon)
+        carbon += gain * pulses[:, t, np.newaxis]
+        c_atm[:, t] = carbon[:, 0]
+        c_mixed[:, t] = carbon[:, 1]
+        c_deep[:, t] = carbon[:, 2:].sum(axis=1)
+
+    c_atm = c_atm.reshape(shape + (steps,))
+    return {
+        'co2ppm': (co2_0[..., np.newaxis] +
+                   c_atm * PGC_TO_MOL / MOLES_IN_ATMOSPHERE * 1e6),
+        'c_atm_pg': c_atm,
+        'c_mixed_pg': c_mixed.reshape(shape + (steps,)),
+        'c_deep_pg': c_deep.reshape(shape + (steps,)),
+    }
+
+
+def box_operator(dt, dz, mixing = 'probable', theta = 0.5):
+    """
+    One-step operator for the box diffusion model, carbon(t + dt) =
+    propagator . carbon(t) + gain * pulse, with carbon the perturbation
+    (PgC) of the atmosphere, mixed layer and each deep ocean layer. Each
+    step solves the theta-scheme tridiagonal system
+    (I - theta dt A) C' = (I + (1 - theta) dt A) C + e_atm pulse;
+    0.5 is Crank-Nicolson and 1 is backward Euler.
+    """
+    key = (float(dt), float(dz), str(mixing), float(theta))
+    if key not in _operator_cache:
+        if mixing not in MIXING_DIFFUSIVITY:
+            raise ValueError('Unknown ocean mixing: ' + str(mixing))
+        diffusivity = MIXING_DIFFUSIVITY[mixing] * 1e-4 * SECONDS_PER_YEAR
+        layers = max(1, int(round(DEEP_OCEAN_DEPTH / dz)))
+        size = layers + 2
+        #Pre-industrial carbon in each ocean box
+        capacity = np.ones(size) * dz * OCEAN_PG_PER_M
+        capacity[1] = MIXED_LAYER_DEPTH * OCEAN_PG_PER_M
+
+        #Flux from box i to box i + 1 is out[i] C[i] - back[i] C[i + 1]:
+        #air-sea exchange k (C_atm - buffer * N_atm / N_mixed * C_mixed),
+        #then diffusion down the gradient between box midpoints
+        spacing = np.ones(size - 2) * dz
+        spacing[0] = dz / 2.
+        out = np.empty(size - 1)
+        back = np.empty(size - 1)
+        out[0] = AIR_SEA_EXCHANGE
+        back[0] = (AIR_SEA_EXCHANGE * BUFFER_FACTOR * ATMOSPHERE_PG_1750 /
+                   capacity[1])
+        out[1:] = diffusivity / spacing * OCEAN_PG_PER_M / capacity[1:-1]
+        back[1:] = diffusivity / spacing * OCEAN_PG_PER_M / capacity[2:]
+
+        lower = np.zeros(size)
+        upper = np.zeros(size)
+        diag = np.zeros(size)
+        lower[1:] = out
+        upper[:-1] = back
+        diag[:-1] -= out
+        diag[1:] -= back
+
+        explicit = (
+            np.diag(1. + (1 - theta) * dt * diag) +
+            np.diag((1 - theta) * dt * lower[1:], -1) +
+            np.diag((1 - theta) * dt * upper[:-1], 1)
+        )
+        atmosphere = np.zeros(size)
+        atmosphere[0] = 1.
+        rhs = np.column_stack((explicit, atmosphere))
+        solved = solve_tridiagonal(
+            -theta * dt * lower, 1. - theta * dt * diag,
+            -theta * dt * upper, rhs)
+        _operator_cache[key] = (solved[:, :-1], solved[:, -1])
+    return _operator_cache[key]
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from simmod_controller import run_simmod
+
+BIAS_YEAR = 2100                #Year whose CO2 concentrations are compared
+
+run_start_year = 1765.          #Run start year
+run_end_year = 2100.            #Inclusive of end year
+dt = 1 #/ 100.                  #years
+c_sens = 1.25                   #Climate sensativity (T = F / LAMBDA)
+
+
+def box_diffusion_bias(rcps, normalize_2000_conc = True):
+    """
+    Box diffusion and RCP atmospheric CO2 (ppm) in BIAS_YEAR for each
+    scenario, with the model's bias against the RCP
+    """
+    rows = []
+    for rcp in rcps:
+        results = run_simmod(run_start_year, run_end_year, dt, rcp, c_sens,
+                             carbon_model='box diffusion',
+                             normalize_2000_conc=normalize_2000_conc)
+        row = results[results['year'] == BIAS_YEAR].iloc[-1]
+        rows.append((rcp, row['rcp_co2_ppm'], row['co2_ppm'],
+                     row['co2_ppm'] - row['rcp_co2_ppm']))
+    return pd.DataFrame(rows, columns=['rcp', 'rcp_co2_ppm', 'co2_ppm', 'bias'])
+
+
+if __name__ == '__main__':
+    for normalize_2000_conc in [True, False]:
+        print('normalize_2000_conc = ' + str(normalize_2000_conc))
+        print(box_diffusion_bias(['2.6', '4.5', '6.0', '8.5'],
+                                 normalize_2000_conc).round(1))
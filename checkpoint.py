@@ -0,0 +1,164 @@
+import pandas as pd
+import numpy as np
+from constants import *
+from concs_pulse_decay import pulse_decay_arrays, add_concentrations
+from heat_diffusion import ocean_column, convolved_surface_temperature, default_theta, OCEAN_PERCENT
+
+#Pulse response model columns carried over from a snapshot
+BURDEN_COLUMNS = ['co2_pg_atm', 'ch4_tg_atm', 'n2o_tg_atm',
+                  'ch4_co2_decay_marginal']
+
+
+class ModelSnapshot(object):
+    """
+    SimMod state at the start of one timestep of a run, from which runs
+    with the same settings and the same emissions up to that timestep can
+    be resumed (see run_simmod). A stage whose state was not recorded, or
+    whose inputs before the snapshot differ, is re-run from the start.
+    """
+    def __init__(self, index, year, inputs, settings):
+        self.index = index          #Timestep the state is taken at
+        self.year = year
+        self.inputs = inputs        #Emissions frame rows before index
+        self.settings = settings    #Run settings that must match on restore
+        self.burdens = None         #Pulse response columns before index
+        self.pools = None           #Kernel pools after index - 1, by gas
+        self.beam = None            #BEAMCarbon.checkpoint_state
+        self.offsets = None         #Year-2000 normalization, once past 2000
+        self.forcing = None         #Total forcing before index
+        self.t_os = None            #Surface ocean temperature before index
+        self.tocean = None          #Ocean layer temperatures at index
+
+    def __repr__(self):
+        return 'ModelSnapshot(index=%r, year=%r)' % (self.index, self.year)
+
+    def check(self, emission_vals, settings):
+        """
+        Raise ValueError unless a run with these settings and emissions
+        frame can resume from the snapshot
+        """
+        if settings != self.settings:
+            raise ValueError('Snapshot was taken with different run settings')
+        if self.index > len(emission_vals) or not prefix_matches(
+                emission_vals.values[:self.index], self.inputs):
+            raise ValueError(
+                'Emissions before ' + str(self.year) + ' differ from the snapshot run')
+
+
+def take_snapshot(emission_vals, year, settings):
+    """
+    Empty snapshot at the first timestep of year, to be filled in as the
+    run reaches each stage
+    """
+    years = emission_vals['year'].values
+    if not years[0] <= year <= years[-1]:
+        raise ValueError('Snapshot year ' + str(year) + ' is outside the run')
+    index = int(np.searchsorted(years, year))
+    return ModelSnapshot(index, year, emission_vals.values[:index].copy(),
+                         settings)
+
+
+def prefix_matches(values, recorded):
+    """
+    Whether two arrays are equal, counting NaNs in the same places as equal
+    """
+    values = np.asarray(values, dtype=float)
+    if values.shape != recorded.shape:
+        return False
+    return bool(np.all(
+        (values == recorded) | (np.isnan(values) & np.isnan(recorded))))
+
+
+def pulse_decay_stage(emission_vals, dt, kernels = None, use_fft = False,
+                      restore = None, snapshot = None):
+    """
+    Pulse response model as in recursive_pulse_decay, continuing from the
+    kernel pools in restore when it has them and recording those at the
+    snapshot timestep.
+    """
+    df = emission_vals
+    start = 0
+    if restore is not None and restore.pools is not None:
+        start = restore.index
+    burdens = pulse_decay_arrays(
+        dt, df['co2_pg'].values[start:], df['ch4_tg'].values[start:],
+        df['n2o_tg'].values[start:], kernels, use_fft,
+        restore.pools if start else None)
+    for column in BURDEN_COLUMNS:
+        if start:
+            df[column] = np.concatenate(
+                (restore.burdens[column], burdens[column]))
+        else:
+            df[column] = burdens[column]
+
+    if snapshot is not None:
+        index = snapshot.index
+        snapshot.burdens = dict(
+            (column, df[column].values[:index].copy())
+            for column in BURDEN_COLUMNS)
+        if index == start:
+            snapshot.pools = restore.pools if start else None
+        elif burdens['pools'] is not None:
+            snapshot.pools = dict(
+                (gas, pools[..., index - start - 1, :].copy())
+                for gas, pools in burdens['pools'].items())
+
+    return add_concentrations(df, df['rcp_co2_ppm'][0], df['rcp_ch4_ppb'][0],
+                              df['rcp_n2o_ppb'][0])
+
+
+def diffusion_stage(results, dt, clim_sens, convolve = False, theta = None,
+                    restore = None, snapshot = None):
+    """
+    Continuous diffusion model as in implicit_diffusion_model. Stepping
+    continues from the ocean layer temperatures in restore when the
+    forcing before it is unchanged, and the layer temperatures at the
+    snapshot timestep are recorded. With convolve t_os comes from
+    convolved_surface_temperature, and the ocean column is only stepped
+    up to the snapshot. theta defaults to default_theta(dt).
+    """
+    if theta is None:
+        theta = default_theta(dt)
+    forcing = results['total_forcing'].values
+    steps = forcing.shape[0]
+    start = 0
+    if (restore is not None and restore.tocean is not None and
+            prefix_matches(forcing[:restore.index], restore.forcing)):
+        start = restore.index
+
+    stops = []
+    if snapshot is not None and snapshot.index > start:
+        stops.append(snapshot.index)
+    if not convolve:
+        stops.append(steps)
+
+    tocean = restore.tocean if start else None
+    if snapshot is not None and snapshot.index == start:
+        snapshot.tocean = None if tocean is None else tocean.copy()
+    pieces = [restore.t_os] if start else []
+    position = start
+    for stop in stops:
+        if stop > position:
+            previous = forcing[position - 1] if position else None
+            t_os, tocean = ocean_column(forcing[position:stop], dt, clim_sens,
+                                        theta, tocean, previous)
+            pieces.append(t_os)
+            position = stop
+        if snapshot is not None and stop == snapshot.index:
+            snapshot.tocean = tocean.copy()
+
+    if convolve:
+        results['t_os'] = convolved_surface_temperature(
+            forcing, dt, clim_sens, theta)
+    else:
+        results['t_os'] = np.concatenate(pieces)
+    if snapshot is not None:
+        snapshot.forcing = forcing[:snapshot.index].copy()
+        snapshot.t_os = results['t_os'].values[:snapshot.index].copy()
+
+    results['t_eq'] = results['total_forcing'] / clim_sens
+    results['t_s'] = (
+        results['t_os'] * OCEAN_PERCENT +
+        results['t_eq'] * (1 - OCEAN_PERCENT)
+    )
+    return results
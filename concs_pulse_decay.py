@@ -1,13 +1,29 @@
 import pandas as pd
 import numpy as np
 from constants import *
+from impulse_response import DEFAULT_KERNELS, pulse_losses, fft_convolve
 
 
-def pulse_decay_runner(run_years, dt, emissions):
+def pulse_decay_runner(run_years, dt, emissions, engine = 'loop',
+                       kernels = None):
     """
     Simple pulse response model adapted from Myhrvold and Caldeira (2012)
     adapted from Joos et al (1996)
+
+    engine selects 'loop', which re-evaluates every pulse over the whole
+    run, 'recursive', which carries the decaying burdens forward in a
+    single pass (see recursive_pulse_decay), or 'fft', which convolves
+    every kernel by FFT. kernels maps 'co2', 'ch4'
+    and 'n2o' to impulse response kernels (see impulse_response); gases
+    left out use the defaults.
     """
+    kernels = gas_kernels(kernels)
+    if engine in ['recursive', 'fft']:
+        return recursive_pulse_decay(run_years, dt, emissions, kernels,
+                                     engine == 'fft')
+    if engine != 'loop':
+        raise ValueError('Unknown pulse decay engine: ' + str(engine))
+
     df = emissions
     co2_0 = df['rcp_co2_ppm'][0] 
     ch4_0 = df['rcp_ch4_ppb'][0] 
@@ -21,7 +37,7 @@ def pulse_decay_runner(run_years, dt, emissions):
     while run_year < run_years:
         df['ch4_step'] = (
             df['ch4_tg'][int(run_year / dt)] * 
-            np.exp(-(df['date'] - run_year) / CH4_EFOLD)
+            kernels['ch4'].response(df['date'] - run_year)
         )
         df['ch4_step'][0:int(run_year / dt)] = 0
         
@@ -34,14 +50,12 @@ def pulse_decay_runner(run_years, dt, emissions):
 
         df['co2_step'] = (
             (df['co2_pg'][int(run_year / dt)] + df['ch4_co2_decay_marginal'][int(run_year / dt)]) * 
-            (0.217 + 0.259 * np.exp(-(df['date'] - run_year) / 172.9) + 
-            0.338 * np.exp(-(df['date'] - run_year) / 18.51) + 
-            0.186 * np.exp(-(df['date'] - run_year) / 1.186))
+            kernels['co2'].response(df['date'] - run_year)
         )
 
         df['n2o_step'] = (
             df['n2o_tg'][int(run_year / dt)] * 
-            np.exp(-(df['date'] - run_year) / N2O_EFOLD)
+            kernels['n2o'].response(df['date'] - run_year)
         )
         df['co2_step'][0:int(run_year / dt)] = 0
         df['n2o_step'][0:int(run_year / dt)] = 0
@@ -52,19 +66,165 @@ def pulse_decay_runner(run_years, dt, emissions):
 
         run_year += dt
 
-    df['co2_ppm']  = (
-        co2_0 + (df['co2_pg_atm'] * 10.**15. / GRAMS_PER_MOLE_CO2) / 
+    df = df.drop(['ch4_step', 'co2_step', 'n2o_step', 'ch4_co2_decay'], axis=1)
+    return add_concentrations(df, co2_0, ch4_0, n2o_0)
+
+
+def recursive_pulse_decay(run_years, dt, emissions, kernels = None,
+                          use_fft = False):
+    """
+    Pulse response model evaluated in a single pass. Kernels that are a
+    sum of exponentials plus a constant carry each atmospheric burden
+    forward as one decaying state per time constant, in O(n); any other
+    kernel, or every kernel when use_fft is set, is applied by FFT
+    convolution in O(n log n).
+    """
+    df = emissions
+    co2_0 = df['rcp_co2_ppm'][0]
+    ch4_0 = df['rcp_ch4_ppb'][0]
+    n2o_0 = df['rcp_n2o_ppb'][0]
+
+    burdens = pulse_decay_arrays(
+        dt, df['co2_pg'].values, df['ch4_tg'].values, df['n2o_tg'].values,
+        kernels, use_fft)
+    for column in ['co2_pg_atm', 'ch4_tg_atm', 'n2o_tg_atm',
+                   'ch4_co2_decay_marginal']:
+        df[column] = burdens[column]
+    return add_concentrations(df, co2_0, ch4_0, n2o_0)
+
+
+def pulse_decay_arrays(dt, co2_pg, ch4_tg, n2o_tg, kernels = None,
+                       use_fft = False, states = None):
+    """
+    Atmospheric burdens from per-timestep emissions arrays. Time runs
+    along the last axis; any leading axes are carried through.
+
+    With sums-of-exponentials kernels and no FFT the results also hold
+    'pools', each gas's kernel pools after every timestep (see
+    ExponentialKernel.pools), and a run can be resumed from the pools of
+    the step before its first emissions by passing them as states
+    ({'co2': ..., 'ch4': ..., 'n2o': ...}).
+    """
+    kernels = gas_kernels(kernels)
+    co2_pg = np.asarray(co2_pg, dtype=float)
+    ch4_tg = np.asarray(ch4_tg, dtype=float)
+    n2o_tg = np.asarray(n2o_tg, dtype=float)
+
+    recursive = not use_fft and all(
+        kernels[gas].is_exponential for gas in ['co2', 'ch4', 'n2o'])
+    if states is not None and not recursive:
+        raise ValueError('Only recursive sums of exponentials can resume from pool states')
+    if recursive:
+        states = states or {}
+        pools = {'ch4': kernels['ch4'].pools(ch4_tg, dt, states.get('ch4'))}
+        ch4_tg_atm = kernels['ch4'].pools_burden(pools['ch4'])
+    else:
+        pools = None
+        ch4_tg_atm = kernel_burden(kernels['ch4'], ch4_tg, dt, use_fft)
+
+    #CO2 from oxidized CH4: the CH4 lost from the atmosphere each step
+    ch4_co2_decay_marginal = (
+        pulse_losses(kernels['ch4'], ch4_tg, ch4_tg_atm, dt) *
+        CO2_PER_TON_CH4 / 10**3
+    )
+
+    if recursive:
+        pools['co2'] = kernels['co2'].pools(
+            co2_pg + ch4_co2_decay_marginal, dt, states.get('co2'))
+        pools['n2o'] = kernels['n2o'].pools(n2o_tg, dt, states.get('n2o'))
+        co2_pg_atm = kernels['co2'].pools_burden(pools['co2'])
+        n2o_tg_atm = kernels['n2o'].pools_burden(pools['n2o'])
+    else:
+        co2_pg_atm = kernel_burden(
+            kernels['co2'], co2_pg + ch4_co2_decay_marginal, dt, use_fft)
+        n2o_tg_atm = kernel_burden(kernels['n2o'], n2o_tg, dt, use_fft)
+
+    return {
+        'co2_pg_atm': co2_pg_atm,
+        'ch4_tg_atm': ch4_tg_atm,
+        'n2o_tg_atm': n2o_tg_atm,
+        'ch4_co2_decay_marginal': ch4_co2_decay_marginal,
+        'pools': pools,
+    }
+
+
+def kernel_burden(kernel, pulses, dt, use_fft = False):
+    """
+    Burden from per-timestep pulses, recursively for sums of exponentials
+    and by FFT convolution otherwise
+    """
+    if use_fft:
+        steps = pulses.shape[-1]
+        return fft_convolve(pulses, kernel.response(np.arange(steps) * dt))
+    return kernel.burden(pulses, dt)
+
+
+def gas_kernels(kernels = None):
+    """
+    Impulse response kernels by gas, filling in the defaults
+    """
+    merged = dict(DEFAULT_KERNELS)
+    if kernels is not None:
+        unknown = set(kernels) - set(merged)
+        if unknown:
+            raise ValueError('No kernel slot for ' + ', '.join(sorted(unknown)))
+        merged.update(kernels)
+    return merged
+
+
+def pulse_decay_batch(dt, co2_pg, ch4_tg, n2o_tg, co2_0, ch4_0, n2o_0,
+                      kernels = None):
+    """
+    Pulse response model for many emission scenarios in one vectorized
+    pass. Emissions are (members x time) arrays per timestep (Pg CO2,
+    Tg CH4, Tg N2O); a 1-D series is broadcast against the others.
+    co2_0, ch4_0 and n2o_0 are the starting concentrations, scalars or
+    one per member; pulse_decay_runner takes them from the first
+    rcp_co2_ppm, rcp_ch4_ppb and rcp_n2o_ppb values of the scenario.
+    Returns a dict of (members x time) burdens and concentrations.
+    """
+    co2_pg, ch4_tg, n2o_tg = np.broadcast_arrays(
+        np.asarray(co2_pg, dtype=float),
+        np.asarray(ch4_tg, dtype=float),
+        np.asarray(n2o_tg, dtype=float))
+    results = pulse_decay_arrays(dt, co2_pg, ch4_tg, n2o_tg, kernels)
+    results['co2_ppm'], results['ch4_ppb'], results['n2o_ppb'] = (
+        burdens_to_concentrations(
+            results['co2_pg_atm'], results['ch4_tg_atm'],
+            results['n2o_tg_atm'], co2_0, ch4_0, n2o_0)
+    )
+    return results
+
+
+def add_concentrations(df, co2_0, ch4_0, n2o_0):
+    """
+    Convert atmospheric burdens to concentrations above the initial
+    concentrations.
+    """
+    df['co2_ppm'], df['ch4_ppb'], df['n2o_ppb'] = burdens_to_concentrations(
+        df['co2_pg_atm'], df['ch4_tg_atm'], df['n2o_tg_atm'],
+        co2_0, ch4_0, n2o_0)
+    return df
+
+
+def burdens_to_concentrations(co2_pg_atm, ch4_tg_atm, n2o_tg_atm,
+                              co2_0, ch4_0, n2o_0):
+    """
+    Concentrations (ppm CO2, ppb CH4, ppb N2O) from atmospheric burdens
+    (Pg CO2, Tg CH4, Tg N2O) added to the initial concentrations.
+    """
+    co2_ppm  = (
+        co2_0 + (co2_pg_atm * 10.**15. / GRAMS_PER_MOLE_CO2) / 
         MOLES_IN_ATMOSPHERE * 10.**6.
     )
 
-    df['ch4_ppb']  = (
-        ch4_0 + (df['ch4_tg_atm'] * 10.**12. / GRAMS_PER_MOLE_CH4) / 
+    ch4_ppb  = (
+        ch4_0 + (ch4_tg_atm * 10.**12. / GRAMS_PER_MOLE_CH4) / 
         MOLES_IN_ATMOSPHERE * 10.**9.
     )
 
-    df['n2o_ppb']  = (
-        n2o_0 + (df['n2o_tg_atm'] * 10.**12. / GRAMS_PER_MOLE_N2O) / 
+    n2o_ppb  = (
+        n2o_0 + (n2o_tg_atm * 10.**12. / GRAMS_PER_MOLE_N2O) / 
         MOLES_IN_ATMOSPHERE * 10.**9.
     )
-    df = df.drop(['ch4_step', 'co2_step', 'n2o_step', 'ch4_co2_decay'], axis=1)
-    return df
\ No newline at end of file
+    return co2_ppm, ch4_ppb, n2o_ppb
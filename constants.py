@@ -15,4 +15,10 @@ CH4_PPB_1750 = 721.89411
 N2O_PPB_1750 = 272.95961
 
 CH4_IND_FORCING_SCALAR = 1. #0.970 / 0.641 #Based on IPCC AR5 WG1 Chapter 8 Supp Mats table 8.SM.6. 
-#Accounts for indirect CH4 forcing due to tropospheric ozone and stratospheric water vapor. Assumed to scale linearly with atmospheric CH4.
\ No newline at end of file
+#Accounts for indirect CH4 forcing due to tropospheric ozone and stratospheric water vapor. Assumed to scale linearly with atmospheric CH4.
+
+#Joos et al (1996) CO2 impulse response: airborne fraction that never decays,
+#then the fractions and e-folding times (years) of the decaying pools
+CO2_IRF_CONSTANT = 0.217
+CO2_IRF_FRACTIONS = (0.259, 0.338, 0.186)
+CO2_IRF_EFOLDS = (172.9, 18.51, 1.186)
@@ -1,15 +1,194 @@
+import hashlib
+import os
+import time
+
 import pandas as pd
 import numpy as np
 from constants import *
 
+#Output column, source column in the annual scenario table, and whether the
+#value is a per-year flux that is scaled by the timestep
+EMISSIONS_COLUMNS = [
+    ('year', 'year', False),
+    ('co2_pg', 'c_emissions_pg', True),
+    ('ch4_tg', 'ch4_emissions_tg', True),
+    ('n2o_tg', 'n2o_emissions_tg', True),
+    ('hist_forcing_wm2', 'hist_forcing_wm2', False),
+    ('co2_forcing_rcp', 'co2_forcing_wm2', False),
+    ('ch4_forcing_rcp', 'ch4_forcing_wm2', False),
+    ('n2o_forcing_rcp', 'n2o_forcing_wm2', False),
+    ('total_forcing_rcp', 'total_forcing_wm2', False),
+    ('rcp_co2_ppm', 'co2_concentration_ppm', False),
+    ('rcp_ch4_ppb', 'ch4_concentration_ppb', False),
+    ('rcp_n2o_ppb', 'n2o_concentration_ppb', False),
+]
+
+#Values used to fill concentrations missing from the historical record
+PREINDUSTRIAL_CONCS = {
+    'rcp_co2_ppm': CO2_PPM_1750,
+    'rcp_ch4_ppb': CH4_PPB_1750,
+    'rcp_n2o_ppb': N2O_PPB_1750,
+}
+
+FIRST_YEAR = 1765
+SCENARIO_DIR = 'emissions'
+
+#Merged annual tables by RCP, with the mtimes of the files they were read from
+_scenario_cache = {}
+#Content digests by scenario file path, with the mtime and size they were taken at
+_fingerprint_cache = {}
+
+
+def scenario_paths(rcp):
+    """
+    Return the RCP and historical CSV paths that make up a scenario
+    """
+    return [
+        os.path.join(SCENARIO_DIR, 'rcp_'+rcp+'_data.csv'),
+        os.path.join(SCENARIO_DIR, 'historical_ghgs.csv'),
+    ]
+
+
+def read_scenario(rcp):
+    """
+    Read the RCP and historical CSVs and merge them into an annual
+    table of contiguous, read-only columns sorted by year
+    """
+    rcp_path, historic_path = scenario_paths(rcp)
+    rcp_emissions = pd.read_csv(rcp_path, sep=',')
+    historic_emissions = pd.read_csv(historic_path, sep=',')
+    annual = pd.concat([rcp_emissions, historic_emissions], ignore_index=True)
+    order = np.argsort(annual['year'].values, kind='mergesort')
+    table = {}
+    for _, source, _ in EMISSIONS_COLUMNS:
+        column = np.ascontiguousarray(annual[source].values[order], dtype=float)
+        column.flags.writeable = False
+        table[source] = column
+    return table
+
+
+def scenario_table(rcp):
+    """
+    Return the merged annual table for an RCP as a dict of read-only
+    column views. Each scenario is parsed once per process and re-read
+    only when one of its source files changes on disk.
+    """
+    paths = scenario_paths(rcp)
+    key = tuple(os.path.abspath(path) for path in paths)
+    mtimes = tuple(os.path.getmtime(path) for path in paths)
+    cached = _scenario_cache.get(key)
+    if cached is None or cached[0] != mtimes:
+        cached = (mtimes, read_scenario(rcp))
+        _scenario_cache[key] = cached
+    return dict((source, column.view()) for source, column in cached[1].items())
+
+
+def scenario_fingerprint(rcp):
+    """
+    Return (file name, SHA-1 of contents) for each file that makes up a
+    scenario. Each file is hashed again only when it changes on disk.
+    """
+    fingerprint = []
+    for path in scenario_paths(rcp):
+        stamp = (os.path.getmtime(path), os.path.getsize(path))
+        key = os.path.abspath(path)
+        cached = _fingerprint_cache.get(key)
+        if cached is None or cached[0] != stamp:
+            with open(path, 'rb') as f:
+                cached = (stamp, hashlib.sha1(f.read()).hexdigest())
+            _fingerprint_cache[key] = cached
+        fingerprint.append((os.path.basename(path), cached[1]))
+    return tuple(fingerprint)
+
+
+def clear_scenario_cache():
+    """
+    Drop all cached scenario tables and fingerprints
+    """
+    _scenario_cache.clear()
+    _fingerprint_cache.clear()
+
 
-def emissions(run_start_year, run_end_year, dt, rcp, add_start = 0, 
+def emissions(run_start_year, run_end_year, dt, rcp, add_start = 0,
               add_end = 0, c_add = 0, ch4_add = 0, n2o_add = 0):
     """
     Take annual emissions from a RCP scenario and return
     emissions by specified start date, end date, and time step
     """
-    run_years = run_end_year - run_start_year + 1 
+    run_years = run_end_year - run_start_year + 1
+    table = scenario_table(rcp)
+
+    if add_start > 0:
+        window = (table['year'] >= add_start) & (table['year'] <= add_end)
+        table['c_emissions_pg'] = np.where(
+            window, table['c_emissions_pg'] + c_add, table['c_emissions_pg'])
+        table['ch4_emissions_tg'] = np.where(
+            window, table['ch4_emissions_tg'] + ch4_add, table['ch4_emissions_tg'])
+        table['n2o_emissions_tg'] = np.where(
+            window, table['n2o_emissions_tg'] + n2o_add, table['n2o_emissions_tg'])
+
+    date = np.arange(0, run_years, dt)
+    rows = int(run_start_year - FIRST_YEAR) + date.astype(int)
+    if rows[-1] >= table['year'].shape[0]:
+        raise ValueError(
+            'No scenario data for ' + str(run_end_year) + ' in RCP ' + rcp)
+
+    df = pd.DataFrame({'date': date}, columns=['date'])
+    for column, source, flux in EMISSIONS_COLUMNS:
+        values = table[source][rows]
+        if flux:
+            values = values * dt
+        if column == 'co2_pg':
+            values = values * C_TO_CO2
+        if column in PREINDUSTRIAL_CONCS:
+            values = np.where(np.isnan(values), PREINDUSTRIAL_CONCS[column], values)
+        df[column] = values
+
+    return df
+
+
+def perturbed_emissions(run_start_year, run_end_year, dt, rcp, add_start,
+                        add_end, c_add = 0, ch4_add = 0, n2o_add = 0):
+    """
+    Emissions for a batch of perturbations of one RCP scenario.
+    add_start, add_end and the *_add amounts are scalars or 1-D arrays
+    with one entry per member. Returns (members x time) arrays of
+    co2_pg, ch4_tg and n2o_tg matching what emissions() gives for each
+    member.
+    """
+    run_years = run_end_year - run_start_year + 1
+    table = scenario_table(rcp)
+    date = np.arange(0, run_years, dt)
+    rows = int(run_start_year - FIRST_YEAR) + date.astype(int)
+    if rows[-1] >= table['year'].shape[0]:
+        raise ValueError(
+            'No scenario data for ' + str(run_end_year) + ' in RCP ' + rcp)
+
+    add_start, add_end, c_add, ch4_add, n2o_add = [
+        np.asarray(value, dtype=float)[..., np.newaxis]
+        for value in np.broadcast_arrays(
+            np.atleast_1d(add_start), add_end, c_add, ch4_add, n2o_add)
+    ]
+    year = table['year'][rows]
+    window = (add_start > 0) & (year >= add_start) & (year <= add_end)
+
+    results = {}
+    for column, source, add in [('co2_pg', 'c_emissions_pg', c_add),
+                                ('ch4_tg', 'ch4_emissions_tg', ch4_add),
+                                ('n2o_tg', 'n2o_emissions_tg', n2o_add)]:
+        annual = table[source][rows]
+        results[column] = np.where(window, annual + add, annual) * dt
+    results['co2_pg'] = results['co2_pg'] * C_TO_CO2
+    return results
+
+
+def emissions_loop(run_start_year, run_end_year, dt, rcp, add_start = 0,
+                   add_end = 0, c_add = 0, ch4_add = 0, n2o_add = 0):
+    """
+    Original cell-by-cell emissions loader, kept as the reference
+    implementation for emissions_timing.
+    """
+    run_years = run_end_year - run_start_year + 1
     rcp_emissions = pd.read_csv('emissions/rcp_'+rcp+'_data.csv', sep=',')
     historic_emissions = pd.read_csv('emissions/historical_ghgs.csv', sep=',')
     emissions = rcp_emissions.append(historic_emissions, ignore_index=True)
@@ -17,15 +196,15 @@ def emissions(run_start_year, run_end_year, dt, rcp, add_start = 0,
     emissions.reset_index(inplace=True)
     if add_start > 0:
         emissions.loc[(
-            (emissions['year'] >= add_start) & (emissions['year'] <= add_end), 
+            (emissions['year'] >= add_start) & (emissions['year'] <= add_end),
             'c_emissions_pg')] = emissions['c_emissions_pg'] + c_add
         emissions.loc[(
-            (emissions['year'] >= add_start) & (emissions['year'] <= add_end), 
+            (emissions['year'] >= add_start) & (emissions['year'] <= add_end),
             'ch4_emissions_tg')] = emissions['ch4_emissions_tg'] + ch4_add
         emissions.loc[(
-            (emissions['year'] >= add_start) & (emissions['year'] <= add_end), 
+            (emissions['year'] >= add_start) & (emissions['year'] <= add_end),
             'n2o_emissions_tg')] = emissions['n2o_emissions_tg'] + n2o_add
-    
+
     total_years = emissions.shape[0]
     subset = emissions[int(run_start_year - 1765):int(run_end_year - 1765 + 1)]
     subset.reset_index(inplace=True)
@@ -47,9 +226,47 @@ def emissions(run_start_year, run_end_year, dt, rcp, add_start = 0,
         df.ix[t, 'rcp_co2_ppm'] = subset['co2_concentration_ppm'][int(df['date'][t])]
         df.ix[t, 'rcp_ch4_ppb'] = subset['ch4_concentration_ppb'][int(df['date'][t])]
         df.ix[t, 'rcp_n2o_ppb'] = subset['n2o_concentration_ppb'][int(df['date'][t])]
-    
+
     df['rcp_co2_ppm'].fillna(CO2_PPM_1750, inplace=True)
     df['rcp_ch4_ppb'].fillna(CH4_PPB_1750, inplace=True)
     df['rcp_n2o_ppb'].fillna(N2O_PPB_1750, inplace=True)
-    
-    return df
\ No newline at end of file
+
+    return df
+
+
+def emissions_timing(run_start_year, run_end_year, dt, rcp, repeats = 3,
+                     **perturbation):
+    """
+    Time the vectorized loader against the original loop and check
+    that both return the same frame. Returns best-of-repeats seconds
+    for each as (vectorized, loop).
+    """
+    timings = []
+    frames = []
+    for loader in [emissions, emissions_loop]:
+        best = None
+        for _ in range(repeats):
+            start = time.time()
+            df = loader(run_start_year, run_end_year, dt, rcp, **perturbation)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        frames.append(df)
+
+    vectorized, loop = frames
+    if list(vectorized.columns) != list(loop.columns):
+        raise AssertionError('Emissions loaders returned different columns')
+    for column in loop.columns:
+        a = vectorized[column].values
+        b = loop[column].values
+        if not ((a == b) | (np.isnan(a) & np.isnan(b))).all():
+            raise AssertionError('Emissions loaders differ in ' + column)
+    return tuple(timings)
+
+
+if __name__ == '__main__':
+    for step in [1, 1 / 10.]:
+        vectorized, loop = emissions_timing(1765., 2100., step, '8.5')
+        print('dt ' + str(step) + ': vectorized ' + '%.4f' % vectorized +
+              's, loop ' + '%.4f' % loop + 's, speedup ' +
+              '%.0f' % (loop / vectorized) + 'x')
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from impulse_response import fft_convolve
 
 #Model Variables
 LAYER_HEIGHT = 100.
@@ -9,6 +10,22 @@ TOTAL_HEIGHT = 3700.
 HEAT_CAPACITY = 3985. * 1024.5 # J m^-3 K^-1
 KAPPA = 5.5 * 10**-5           #m^2 s^-1
 OCEAN_PERCENT = 0.71
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+LAYERS = int(TOTAL_HEIGHT / LAYER_HEIGHT) + 1
+
+#Step operators by (dt, clim_sens, theta)
+_operator_cache = {}
+#Unit-forcing step responses by (clim_sens, dt, steps, theta)
+_step_response_cache = {}
+
+
+def default_theta(dt):
+    """
+    Theta scheme used when none is given: 0, which reproduces the
+    original explicit scheme, for 1 year timesteps, and Crank-Nicolson
+    for any other timestep, where the explicit scheme breaks down
+    """
+    return 0. if dt == 1 else 0.5
 
 
 def diffeqs(df, dt, fradfor, clim_sens):
@@ -34,11 +51,24 @@ def diffeqs(df, dt, fradfor, clim_sens):
     return df
 
 
-def continuous_diffusion_model(results, run_years, dt, clim_sens):
+def continuous_diffusion_model(results, run_years, dt, clim_sens,
+                               engine = 'explicit', theta = None):
     """
     Implement the continuous diffusion model
     used in Myhrvold and Cairdira (2011).
+
+    engine selects 'explicit', the original scheme on a DataFrame of
+    ocean layers (correct only for dt = 1), 'implicit' (see
+    implicit_diffusion_model) or 'convolution', which gives the implicit
+    result by convolving the forcing with a cached step response. theta
+    defaults to default_theta(dt).
     """
+    if engine in ['implicit', 'convolution']:
+        return implicit_diffusion_model(results, run_years, dt, clim_sens,
+                                        theta, engine == 'convolution')
+    if engine != 'explicit':
+        raise ValueError('Unknown diffusion engine: ' + str(engine))
+
     z = np.array([np.arange(0, (TOTAL_HEIGHT + LAYER_HEIGHT), LAYER_HEIGHT)]).T
     columns = ['z']
     df = pd.DataFrame(z, columns=columns)
@@ -60,4 +90,235 @@ def continuous_diffusion_model(results, run_years, dt, clim_sens):
         results['t_eq'] * (1 - OCEAN_PERCENT)
     )
 
-    return results
\ No newline at end of file
+    return results
+
+
+def implicit_diffusion_model(results, run_years, dt, clim_sens, theta = None,
+                             convolve = False):
+    """
+    Continuous diffusion model on NumPy arrays. Each step solves the
+    tridiagonal layer system with a theta scheme: 0.5 is Crank-Nicolson,
+    1 is backward Euler (both stable for any dt) and 0 reproduces the
+    explicit scheme. As in the explicit model, each step is driven by
+    the previous step's forcing. With convolve, the same result comes
+    from convolved_surface_temperature. theta defaults to
+    default_theta(dt).
+    """
+    if theta is None:
+        theta = default_theta(dt)
+    forcing = results['total_forcing'].values
+    if convolve:
+        results['t_os'] = convolved_surface_temperature(
+            forcing, dt, clim_sens, theta)
+    else:
+        results['t_os'] = ocean_surface_temperature(
+            forcing, dt, clim_sens, theta)
+    results['t_eq'] = results['total_forcing'] / clim_sens
+    results['t_s'] = (
+        results['t_os'] * OCEAN_PERCENT +
+        results['t_eq'] * (1 - OCEAN_PERCENT)
+    )
+
+    return results
+
+
+def diffusion_ensemble(forcing, dt, clim_sens, theta = None, convolve = False):
+    """
+    Continuous diffusion model for many members at once. forcing is a
+    (members x time) array, or a single series shared by all members;
+    clim_sens is a scalar or one value per member. Returns a dict of
+    (members x time) t_os, t_eq and t_s arrays. theta defaults to
+    default_theta(dt).
+    """
+    if theta is None:
+        theta = default_theta(dt)
+    forcing = np.asarray(forcing, dtype=float)
+    clim_sens = np.asarray(clim_sens, dtype=float)
+    if convolve:
+        t_os = convolved_surface_temperature(forcing, dt, clim_sens, theta)
+    else:
+        t_os = ocean_surface_temperature(forcing, dt, clim_sens, theta)
+    t_eq = forcing / clim_sens[..., np.newaxis]
+    t_s = t_os * OCEAN_PERCENT + t_eq * (1 - OCEAN_PERCENT)
+    return {'t_os': t_os, 't_eq': t_eq, 't_s': t_s}
+
+
+def ocean_surface_temperature(forcing, dt, clim_sens, theta = 0.5):
+    """
+    Surface ocean temperature at the end of each step for a forcing
+    series (W/m^2), starting from an ocean at equilibrium. Time runs
+    along the last axis of forcing; leading axes are ensemble members,
+    which clim_sens is broadcast against. All ocean columns are advanced
+    together as a (members x layers) array.
+    """
+    return ocean_column(forcing, dt, clim_sens, theta)[0]
+
+
+def ocean_column(forcing, dt, clim_sens, theta = 0.5, tocean = None,
+                 previous = None):
+    """
+    Surface ocean temperatures as in ocean_surface_temperature, along
+    with the layer temperatures (members x layers) after the last step.
+    A run can be resumed part way through by passing the layer
+    temperatures it had reached as tocean and the forcing of the step
+    before the series, which drives its first step, as previous.
+    """
+    forcing = np.asarray(forcing, dtype=float)
+    clim_sens = np.asarray(clim_sens, dtype=float)
+    shape = np.broadcast(forcing[..., 0], clim_sens).shape
+    steps = forcing.shape[-1]
+    if previous is None:
+        drive = lagged_forcing(forcing)
+    else:
+        drive = np.concatenate(
+            (np.asarray(previous, dtype=float)[..., np.newaxis] +
+             np.zeros(forcing.shape[:-1] + (1,)), forcing[..., :-1]),
+            axis=-1)
+    drive = np.broadcast_to(drive, shape + (steps,)).reshape((-1, steps))
+    members = drive.shape[0]
+
+    sens, member_sens = np.unique(
+        np.broadcast_to(clim_sens, shape).ravel(), return_inverse=True)
+    operators = [diffusion_operator(dt, value, theta) for value in sens]
+    gain = np.array([operator[1] for operator in operators])[member_sens]
+    shared = len(operators) == 1
+    if shared:
+        propagator_t = operators[0][0].T
+    else:
+        propagator = np.array(
+            [operator[0] for operator in operators])[member_sens]
+
+    if tocean is None:
+        tocean = np.zeros((members, LAYERS))
+    else:
+        tocean = np.array(np.broadcast_to(
+            np.asarray(tocean, dtype=float), shape + (LAYERS,)
+        )).reshape((members, LAYERS))
+    t_os = np.empty((members, steps))
+    for t in range(steps):
+        if shared:
+            tocean = tocean.dot(propagator_t)
+        else:
+            tocean = np.einsum('mij,mj->mi', propagator, tocean)
+        tocean += gain * drive[:, t, np.newaxis]
+        t_os[:, t] = tocean[:, 0]
+    return t_os.reshape(shape + (steps,)), tocean.reshape(shape + (LAYERS,))
+
+
+def convolved_surface_temperature(forcing, dt, clim_sens, theta = 0.5):
+    """
+    Surface ocean temperature from the linearity of the diffusion model:
+    the response to any forcing series is the sum of step responses to
+    its increments, computed by FFT convolution with the cached unit
+    step response. Matches ocean_surface_temperature to rounding.
+    """
+    forcing = np.asarray(forcing, dtype=float)
+    clim_sens = np.asarray(clim_sens, dtype=float)
+    shape = np.broadcast(forcing[..., 0], clim_sens).shape
+    steps = forcing.shape[-1]
+    drive = np.broadcast_to(
+        lagged_forcing(forcing), shape + (steps,)).reshape((-1, steps))
+    increments = np.concatenate(
+        (drive[:, :1], np.diff(drive, axis=-1)), axis=-1)
+
+    sens, member_sens = np.unique(
+        np.broadcast_to(clim_sens, shape).ravel(), return_inverse=True)
+    t_os = np.empty(drive.shape)
+    for i, value in enumerate(sens):
+        members = member_sens == i
+        t_os[members] = fft_convolve(
+            increments[members], step_response(dt, value, steps, theta))
+    return t_os.reshape(shape + (steps,))
+
+
+def step_response(dt, clim_sens, steps, theta = 0.5):
+    """
+    Surface ocean temperature after each step of a constant 1 W/m^2
+    forcing, computed once per (clim_sens, dt, steps, theta) by time
+    stepping and cached as a read-only array
+    """
+    key = (float(clim_sens), float(dt), int(steps), float(theta))
+    if key not in _step_response_cache:
+        response = ocean_surface_temperature(
+            np.ones(steps), dt, clim_sens, theta)
+        response.flags.writeable = False
+        _step_response_cache[key] = response
+    return _step_response_cache[key]
+
+
+def verify_step_response(forcing, dt, clim_sens, theta = 0.5,
+                         tolerance = 1e-9):
+    """
+    Check convolved_surface_temperature against time stepping for a
+    forcing series (or ensemble). Returns the largest absolute
+    difference in K, raising AssertionError above tolerance.
+    """
+    stepped = ocean_surface_temperature(forcing, dt, clim_sens, theta)
+    convolved = convolved_surface_temperature(forcing, dt, clim_sens, theta)
+    difference = np.max(np.abs(stepped - convolved))
+    if difference > tolerance:
+        raise AssertionError(
+            'Step response convolution differs from time stepping by ' +
+            str(difference) + ' K')
+    return difference
+
+
+def lagged_forcing(forcing):
+    """
+    Forcing that drives each step: the previous step's forcing, with the
+    first forcing value used for the first two steps
+    """
+    return np.concatenate((forcing[..., :1], forcing[..., :-1]), axis=-1)
+
+
+def diffusion_operator(dt, clim_sens, theta = 0.5):
+    """
+    One-step operator for the ocean column, tocean(t + dt) =
+    propagator . tocean(t) + gain * forcing, from the theta-scheme
+    tridiagonal system (I - theta dt A) T' = (I + (1 - theta) dt A) T + dt b F
+    """
+    key = (float(dt), float(clim_sens), float(theta))
+    if key not in _operator_cache:
+        seconds = dt * SECONDS_PER_YEAR
+        exchange = KAPPA / LAYER_HEIGHT ** 2
+        lower = np.ones(LAYERS) * exchange
+        upper = np.ones(LAYERS) * exchange
+        lower[0] = 0.
+        upper[-1] = 0.
+        diag = -(lower + upper)
+        #Surface layer loses heat to space at clim_sens W/m^2/K
+        diag[0] -= clim_sens / (HEAT_CAPACITY * LAYER_HEIGHT)
+        surface = np.zeros(LAYERS)
+        surface[0] = 1. / (HEAT_CAPACITY * LAYER_HEIGHT)
+
+        explicit = (
+            np.diag(1. + (1 - theta) * seconds * diag) +
+            np.diag((1 - theta) * seconds * lower[1:], -1) +
+            np.diag((1 - theta) * seconds * upper[:-1], 1)
+        )
+        rhs = np.column_stack((explicit, seconds * surface))
+        solved = solve_tridiagonal(
+            -theta * seconds * lower, 1. - theta * seconds * diag,
+            -theta * seconds * upper, rhs)
+        _operator_cache[key] = (solved[:, :-1], solved[:, -1])
+    return _operator_cache[key]
+
+
+def solve_tridiagonal(lower, diag, upper, rhs):
+    """
+    Solve a tridiagonal system by the Thomas algorithm. lower[i] and
+    upper[i] multiply x[i - 1] and x[i + 1] in row i; rhs may have
+    trailing columns, which are solved together.
+    """
+    size = diag.shape[0]
+    upper_prime = np.empty(size)
+    rhs_prime = np.array(rhs, dtype=float)
+    upper_prime[0] = upper[0] / diag[0]
+    rhs_prime[0] = rhs_prime[0] / diag[0]
+    for i in range(1, size):
+        pivot = diag[i] - lower[i] * upper_prime[i - 1]
+        upper_prime[i] = upper[i] / pivot
+        rhs_prime[i] = (rhs_prime[i] - lower[i] * rhs_prime[i - 1]) / pivot
+    for i in range(size - 2, -1, -1):
+        rhs_prime[i] = rhs_prime[i] - upper_prime[i] * rhs_prime[i + 1]
+    return rhs_prime
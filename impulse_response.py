@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+from constants import *
+
+
+class ExponentialKernel(object):
+    """
+    Impulse response made of a constant plus a sum of exponentials,
+    K(t) = constant + sum(fractions * exp(-t / efolds)).
+    Pulses convolved with it are carried forward recursively.
+    """
+    is_exponential = True
+
+    def __init__(self, constant = 0., fractions = (), efolds = ()):
+        if len(fractions) != len(efolds):
+            raise ValueError('Each exponential needs a fraction and an e-fold time')
+        self.constant = float(constant)
+        self.fractions = tuple(float(f) for f in fractions)
+        self.efolds = tuple(float(e) for e in efolds)
+
+    def __repr__(self):
+        return 'ExponentialKernel(%r, %r, %r)' % (
+            self.constant, self.fractions, self.efolds)
+
+    def response(self, t):
+        """
+        Fraction of a pulse remaining in the atmosphere after t years
+        """
+        k = self.constant
+        for fraction, efold in zip(self.fractions, self.efolds):
+            k = k + fraction * np.exp(-t / efold)
+        return k
+
+    def burden(self, pulses, dt, state = None):
+        """
+        Burden from per-timestep pulses along the last axis, optionally
+        continuing from a pools state (see pools)
+        """
+        return self.pools_burden(self.pools(pulses, dt, state))
+
+    def pools(self, pulses, dt, state = None):
+        """
+        Pool contents after each timestep, (..., steps, 1 + exponentials):
+        the running sum of pulses held by the constant, then each decaying
+        pool before weighting by its fraction. state is the pools entry of
+        the step before the first pulse, for resuming a run.
+        """
+        pulses = np.asarray(pulses, dtype=float)
+        decays = np.exp(-dt / np.array(self.efolds))
+        pools = np.empty(pulses.shape + (1 + len(self.efolds),))
+        if state is None:
+            pools[..., 0] = np.cumsum(pulses, axis=-1)
+            pools[..., 1:] = exponential_filter(pulses, decays)
+        else:
+            state = np.asarray(state, dtype=float)
+            pools[..., 0] = state[..., 0, np.newaxis] + np.cumsum(pulses, axis=-1)
+            pools[..., 1:] = exponential_filter(pulses, decays, state[..., 1:])
+        return pools
+
+    def pools_burden(self, pools):
+        """
+        Burden held by pools (see pools)
+        """
+        burden = self.constant * pools[..., 0]
+        if self.efolds:
+            burden = burden + pools[..., 1:].dot(np.array(self.fractions))
+        return burden
+
+
+class SampledKernel(object):
+    """
+    Impulse response sampled on the model timesteps, through the
+    response method of a subclass. Pulses convolved with it use FFT
+    convolution.
+    """
+    is_exponential = False
+
+    def response(self, t):
+        """
+        Fraction of a pulse remaining in the atmosphere after t years
+        """
+        raise NotImplementedError
+
+    def burden(self, pulses, dt):
+        """
+        Burden from per-timestep pulses along the last axis
+        """
+        steps = pulses.shape[-1]
+        return fft_convolve(pulses, self.response(np.arange(steps) * dt))
+
+
+class TabulatedKernel(SampledKernel):
+    """
+    Impulse response given at tabulated times and linearly interpolated,
+    holding the last value beyond the end of the table
+    """
+    def __init__(self, times, values):
+        self.times = np.array(times, dtype=float)
+        self.values = np.array(values, dtype=float)
+        if self.times.ndim != 1 or self.times.shape != self.values.shape:
+            raise ValueError('Kernel times and values must be matching 1-D arrays')
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError('Kernel times must be increasing')
+
+    @classmethod
+    def from_csv(cls, path, time_column = None, value_column = None):
+        """
+        Read a kernel from a CSV file, by default from its first two
+        columns (time in years, remaining fraction)
+        """
+        df = pd.read_csv(path, sep=',')
+        time_column = df.columns[0] if time_column is None else time_column
+        value_column = df.columns[1] if value_column is None else value_column
+        return cls(df[time_column].values, df[value_column].values)
+
+    def __repr__(self):
+        return 'TabulatedKernel(%r, %r)' % (
+            self.times.tolist(), self.values.tolist())
+
+    def response(self, t):
+        """
+        Fraction of a pulse remaining in the atmosphere after t years
+        """
+        return np.interp(t, self.times, self.values)
+
+
+class FunctionKernel(SampledKernel):
+    """
+    Impulse response given as a function of time in years
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def __repr__(self):
+        return 'FunctionKernel(%r)' % (self.function,)
+
+    def response(self, t):
+        """
+        Fraction of a pulse remaining in the atmosphere after t years
+        """
+        return self.function(np.asarray(t, dtype=float))
+
+
+def exponential_filter(pulses, decays, state = None):
+    """
+    Carry pulses forward along the last axis under exponential decay,
+    out[..., k, i] = out[..., k - 1, i] * decays[i] + pulses[..., k].
+    state is the optional starting value of out[..., -1, :].
+    """
+    steps = pulses.shape[-1]
+    out = np.empty(pulses.shape + decays.shape)
+    if state is None:
+        acc = np.zeros(pulses.shape[:-1] + decays.shape)
+    else:
+        acc = np.array(state, dtype=float)
+    for k in range(steps):
+        acc = acc * decays + pulses[..., k, np.newaxis]
+        out[..., k, :] = acc
+    return out
+
+
+def fft_convolve(pulses, response):
+    """
+    Causal convolution of pulses with a sampled response along the last
+    axis, out[..., k] = sum(pulses[..., j] * response[k - j], j <= k),
+    in O(n log n)
+    """
+    steps = pulses.shape[-1]
+    size = 1
+    while size < 2 * steps - 1:
+        size *= 2
+    out = np.fft.irfft(
+        np.fft.rfft(pulses, size, axis=-1) * np.fft.rfft(response, size),
+        size, axis=-1)
+    return out[..., :steps]
+
+
+def pulse_losses(kernel, pulses, burden, dt):
+    """
+    Mass that leaves the atmosphere between each timestep and the next,
+    from the burden at k and k + 1. The last timestep has no successor
+    and loses nothing.
+    """
+    losses = np.zeros(burden.shape)
+    losses[..., :-1] = (
+        burden[..., :-1] + pulses[..., 1:] * kernel.response(0.) -
+        burden[..., 1:]
+    )
+    return losses
+
+
+CO2_KERNEL = ExponentialKernel(
+    CO2_IRF_CONSTANT, CO2_IRF_FRACTIONS, CO2_IRF_EFOLDS)
+CH4_KERNEL = ExponentialKernel(0., (1.,), (CH4_EFOLD,))
+N2O_KERNEL = ExponentialKernel(0., (1.,), (N2O_EFOLD,))
+
+DEFAULT_KERNELS = {
+    'co2': CO2_KERNEL,
+    'ch4': CH4_KERNEL,
+    'n2o': N2O_KERNEL,
+}
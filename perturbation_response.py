@@ -0,0 +1,238 @@
+import pandas as pd
+import numpy as np
+from constants import *
+from concs_pulse_decay import pulse_decay_arrays, burdens_to_concentrations, gas_kernels
+from radiative_forcing import ghg_forcing, ghg_forcing_gradient
+from heat_diffusion import convolved_surface_temperature, step_response, lagged_forcing, default_theta, OCEAN_PERCENT
+from impulse_response import fft_convolve
+
+GASES = ['co2', 'ch4', 'n2o']
+
+
+class PerturbationResponse(object):
+    """
+    Linearized response of t_s to emission perturbations around a
+    baseline pulse response run.
+
+    The carbon and diffusion stages are linear, so the only nonlinearity
+    is the log and sqrt forcing, which is linearized around the baseline
+    concentrations. The resulting Jacobian of t_s with respect to
+    per-timestep emissions turns any perturbation profile into a
+    matrix-vector product. Matches run_simmod differences when the
+    controller uses the 'convolution' or 'implicit' diffusion engines.
+    """
+    def __init__(self, baseline, dt, clim_sens, normalize_2000_conc = True,
+                 kernels = None, theta = None):
+        """
+        Args:
+            :param baseline: Unperturbed run_simmod results
+            :type baseline: pd.DataFrame
+            :param dt: Timestep in years
+            :type dt: float
+            :param clim_sens: Climate sensitivity (T = F / LAMBDA)
+            :type clim_sens: float
+            :param normalize_2000_conc: Whether the baseline run
+                normalized concentrations to year-2000 values
+            :type normalize_2000_conc: bool
+            :param kernels: Impulse response kernels by gas
+            :type kernels: dict
+            :param theta: Diffusion theta scheme; defaults to
+                heat_diffusion.default_theta(dt), as in run_simmod
+            :type theta: float
+        """
+        self.dt = dt
+        self.clim_sens = float(clim_sens)
+        self.theta = default_theta(dt) if theta is None else theta
+        self.kernels = gas_kernels(kernels)
+        self.year = baseline['year'].values
+        self.steps = self.year.shape[0]
+        self.concentrations = (
+            baseline['co2_ppm'].values,
+            baseline['ch4_ppb'].values,
+            baseline['n2o_ppb'].values,
+        )
+
+        #Rows whose concentrations set the year-2000 normalization
+        self.normalize_rows = None
+        if normalize_2000_conc:
+            rows = np.flatnonzero(self.year == 2000)
+            self.normalize_rows = [
+                rows[np.argmin(conc[rows])] for conc in self.concentrations
+            ]
+
+        #Before 2000 total forcing is pinned to historical forcing where
+        #it is recorded, so GHG forcing changes have no effect there
+        historic = baseline['hist_forcing_wm2'].values
+        self.forcing_mask = np.where(
+            (self.year < 2000) & ~np.isnan(historic), 0., 1.)
+        self.gradient = ghg_forcing_gradient(*self.concentrations)
+        self.curvature = self._forcing_curvature()
+
+        self._jacobians = {}
+
+    def jacobian(self, gas):
+        """
+        (time x emission step) matrix of d t_s / d emissions for 'co2'
+        (Pg CO2 per step), 'ch4' or 'n2o' (Tg per step). Built on first
+        use; memory grows with the square of the number of steps.
+        """
+        if gas not in self._jacobians:
+            if gas not in GASES:
+                raise ValueError('Unknown gas: ' + str(gas))
+            pulses = dict((name, 0.) for name in GASES)
+            pulses[gas] = np.eye(self.steps)
+            self._jacobians[gas] = self.linear_response(**pulses).T
+        return self._jacobians[gas]
+
+    def delta_t_s(self, co2 = None, ch4 = None, n2o = None):
+        """
+        Linearized change in t_s for per-timestep emission changes, as
+        Jacobian-vector products. Profiles may be (members x time).
+        """
+        delta = 0.
+        for gas, profile in zip(GASES, [co2, ch4, n2o]):
+            if profile is not None:
+                delta = delta + np.dot(profile, self.jacobian(gas).T)
+        return delta + np.zeros(self.steps)
+
+    def linear_response(self, co2 = 0., ch4 = 0., n2o = 0.):
+        """
+        Linearized change in t_s, applying each stage in turn rather
+        than the stored Jacobians
+        """
+        return self._temperature(self._forcing_change(
+            self._concentration_change(co2, ch4, n2o)))
+
+    def exact_response(self, co2 = 0., ch4 = 0., n2o = 0.):
+        """
+        Change in t_s with the full nonlinear forcing, equivalent to an
+        exact re-run of the perturbed scenario
+        """
+        changes = self._concentration_change(co2, ch4, n2o)
+        perturbed = ghg_forcing(*[
+            conc + change for conc, change in zip(self.concentrations, changes)
+        ])
+        base = ghg_forcing(*self.concentrations)
+        forcing = sum(p - b for p, b in zip(perturbed, base)) * self.forcing_mask
+        return self._temperature(forcing)
+
+    def error_bound(self, co2 = 0., ch4 = 0., n2o = 0.):
+        """
+        Bound on the linearization error in t_s: the Lagrange remainder
+        of the forcing, 0.5 max|F''| dC^2 per gas with the curvature
+        taken at whichever end of [C, C + dC] it is larger (|F''| is
+        monotone there for the log and sqrt forcing), carried through
+        the absolute diffusion response
+        """
+        changes = self._concentration_change(co2, ch4, n2o)
+        perturbed = [conc + change
+                     for conc, change in zip(self.concentrations, changes)]
+        curvature = [
+            np.maximum(np.abs(base), np.abs(end)) for base, end in
+            zip(self.curvature, self._forcing_curvature(perturbed))]
+        remainder = sum(
+            0.5 * curve * change ** 2
+            for curve, change in zip(curvature, changes)
+        ) * self.forcing_mask
+        response = step_response(self.dt, self.clim_sens, self.steps, self.theta)
+        impulse = np.abs(np.diff(np.concatenate(([0.], response))))
+        return (
+            fft_convolve(lagged_forcing(remainder), impulse) * OCEAN_PERCENT +
+            remainder / self.clim_sens * (1 - OCEAN_PERCENT)
+        )
+
+    def evaluate(self, co2 = None, ch4 = None, n2o = None, tolerance = 1e-3,
+                 rerun = True):
+        """
+        Linearized t_s changes with their estimated error bounds. Members
+        whose bound exceeds tolerance (K) at any step are flagged and,
+        with rerun, replaced by exact_response.
+
+        Returns:
+            :return: (delta t_s, error bound, flagged members)
+            :rtype: tuple
+        """
+        delta = self.delta_t_s(co2, ch4, n2o)
+        profiles = dict(
+            (gas, 0. if profile is None else profile)
+            for gas, profile in zip(GASES, [co2, ch4, n2o]))
+        bound = self.error_bound(**profiles) + np.zeros(delta.shape)
+        flagged = np.max(bound, axis=-1) > tolerance
+        if rerun and np.any(flagged):
+            if delta.ndim == 1:
+                delta = self.exact_response(**profiles)
+            else:
+                selected = dict(
+                    (gas, np.broadcast_to(profile, delta.shape)[flagged])
+                    for gas, profile in profiles.items())
+                delta = delta.copy()
+                delta[flagged] = self.exact_response(**selected)
+        return delta, bound, flagged
+
+    def profile(self, add_start, add_end, c_add = 0, ch4_add = 0, n2o_add = 0):
+        """
+        Per-timestep emission changes for a run_simmod perturbation
+        (c_add in PgC per year, ch4_add and n2o_add in Tg per year),
+        as keyword arguments for delta_t_s and friends
+        """
+        window = (add_start > 0) & (self.year >= add_start) & (self.year <= add_end)
+        window = np.where(window, self.dt, 0.)
+        return {
+            'co2': window * c_add * C_TO_CO2,
+            'ch4': window * ch4_add,
+            'n2o': window * n2o_add,
+        }
+
+    def _concentration_change(self, co2, ch4, n2o):
+        """
+        Changes in (normalized) concentrations from emission changes
+        """
+        co2, ch4, n2o = np.broadcast_arrays(
+            np.asarray(co2, dtype=float) + np.zeros(self.steps),
+            np.asarray(ch4, dtype=float), np.asarray(n2o, dtype=float))
+        burdens = pulse_decay_arrays(self.dt, co2, ch4, n2o, self.kernels)
+        changes = burdens_to_concentrations(
+            burdens['co2_pg_atm'], burdens['ch4_tg_atm'],
+            burdens['n2o_tg_atm'], 0., 0., 0.)
+        if self.normalize_rows is None:
+            return changes
+        return tuple(
+            change - change[..., row, np.newaxis]
+            for change, row in zip(changes, self.normalize_rows))
+
+    def _forcing_change(self, changes):
+        """
+        Linearized total forcing change from concentration changes
+        """
+        return sum(
+            gradient * change for gradient, change in zip(self.gradient, changes)
+        ) * self.forcing_mask
+
+    def _temperature(self, forcing):
+        """
+        t_s change for a forcing change, by the linear diffusion model
+        """
+        t_os = convolved_surface_temperature(
+            forcing, self.dt, self.clim_sens, self.theta)
+        return t_os * OCEAN_PERCENT + forcing / self.clim_sens * (1 - OCEAN_PERCENT)
+
+    def _forcing_curvature(self, concentrations = None):
+        """
+        Second derivatives of each gas's forcing, at the baseline or the
+        given concentrations, by central differences of the analytic
+        gradient
+        """
+        if concentrations is None:
+            concentrations = self.concentrations
+        concentrations = np.broadcast_arrays(*concentrations)
+        step = 1e-4
+        curvature = []
+        for i, conc in enumerate(concentrations):
+            up = list(concentrations)
+            down = list(concentrations)
+            up[i] = conc * (1 + step)
+            down[i] = conc * (1 - step)
+            curvature.append(
+                (ghg_forcing_gradient(*up)[i] - ghg_forcing_gradient(*down)[i]) /
+                (2 * step * conc))
+        return curvature
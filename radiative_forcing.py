@@ -8,19 +8,10 @@ def calc_radiative_forcing(concentrations):
     Translate GHG concentrations into radiative forcing using IPCC
     simplified forcing functions for CO2, CH4, and N2O
     """
-    concentrations['co2_forcing'] = (
-        5.35 * np.log(concentrations['co2_ppm'] / CO2_PPM_1750)
-    )
-
-    concentrations['ch4_forcing'] = (
-        0.036 * (np.sqrt(concentrations['ch4_ppb']) - np.sqrt(CH4_PPB_1750)) - 
-        (func(concentrations['ch4_ppb'], N2O_PPB_1750) - func(CH4_PPB_1750, N2O_PPB_1750))
-    ) * CH4_IND_FORCING_SCALAR
-
-    concentrations['n2o_forcing'] = (
-        0.12 * (np.sqrt(concentrations['n2o_ppb']) - np.sqrt(N2O_PPB_1750)) - 
-        (func(CH4_PPB_1750, concentrations['n2o_ppb']) - func(CH4_PPB_1750, N2O_PPB_1750))
-    )
+    (concentrations['co2_forcing'], concentrations['ch4_forcing'],
+     concentrations['n2o_forcing']) = ghg_forcing(
+        concentrations['co2_ppm'], concentrations['ch4_ppb'],
+        concentrations['n2o_ppb'])
 
     concentrations['total_forcing_ghg'] = (
         concentrations['co2_forcing'] +
@@ -55,6 +46,54 @@ def calc_radiative_forcing(concentrations):
     return concentrations
 
 
+def ghg_forcing(co2_ppm, ch4_ppb, n2o_ppb):
+    """
+    IPCC simplified forcing functions (W/m^2) for CO2, CH4, and N2O
+    concentrations, relative to 1750
+    """
+    co2_forcing = 5.35 * np.log(co2_ppm / CO2_PPM_1750)
+
+    ch4_forcing = (
+        0.036 * (np.sqrt(ch4_ppb) - np.sqrt(CH4_PPB_1750)) - 
+        (func(ch4_ppb, N2O_PPB_1750) - func(CH4_PPB_1750, N2O_PPB_1750))
+    ) * CH4_IND_FORCING_SCALAR
+
+    n2o_forcing = (
+        0.12 * (np.sqrt(n2o_ppb) - np.sqrt(N2O_PPB_1750)) - 
+        (func(CH4_PPB_1750, n2o_ppb) - func(CH4_PPB_1750, N2O_PPB_1750))
+    )
+    return co2_forcing, ch4_forcing, n2o_forcing
+
+
+def ghg_forcing_gradient(co2_ppm, ch4_ppb, n2o_ppb):
+    """
+    Derivatives of ghg_forcing with respect to each gas's concentration
+    (W/m^2 per ppm CO2, per ppb CH4 and per ppb N2O)
+    """
+    co2_gradient = 5.35 / co2_ppm
+    ch4_gradient = (
+        0.018 / np.sqrt(ch4_ppb) - func_gradient(ch4_ppb, N2O_PPB_1750)[0]
+    ) * CH4_IND_FORCING_SCALAR
+    n2o_gradient = (
+        0.06 / np.sqrt(n2o_ppb) - func_gradient(CH4_PPB_1750, n2o_ppb)[1]
+    )
+    return co2_gradient, ch4_gradient, n2o_gradient
+
+
+def func_gradient(ch4, n2o):
+    """
+    Derivatives of the CH4/N2O spectral overlap function with respect
+    to CH4 and to N2O
+    """
+    product = ch4 * n2o
+    overlap = 2.01 * 10**-5 * product**0.75
+    cross = 5.31 * 10**-15 * ch4 * product**1.52
+    total = 1 + overlap + cross
+    d_ch4 = 0.47 * (0.75 * overlap + 2.52 * cross) / (total * ch4)
+    d_n2o = 0.47 * (0.75 * overlap + 1.52 * cross) / (total * n2o)
+    return d_ch4, d_n2o
+
+
 def func(ch4, n2o):
     """
     IPCC simplified function for calculating CH4/N2O spectral overlap
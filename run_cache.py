@@ -0,0 +1,277 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+
+#Source files whose code determines run results, relative to this module
+MODEL_SOURCES = ['constants.py', 'emissions_parser.py', 'concs_pulse_decay.py',
+                 'impulse_response.py', 'radiative_forcing.py',
+                 'heat_diffusion.py', 'box_diffusion.py', 'checkpoint.py',
+                 'run_config.py', 'simmod_controller.py', 'scenario_tree.py']
+BEAM_SOURCE_DIR = os.path.join('beam_model', 'beam_carbon')
+
+#Digest of the model sources, taken once per process
+_code_version = []
+
+
+def code_version():
+    """
+    SHA-1 of the model source code (MODEL_SOURCES and the BEAM package),
+    so that cached results are not reused after the model changes
+    """
+    if not _code_version:
+        here = os.path.dirname(os.path.abspath(__file__))
+        beam_dir = os.path.join(here, BEAM_SOURCE_DIR)
+        paths = [os.path.join(here, name) for name in MODEL_SOURCES]
+        if os.path.isdir(beam_dir):
+            paths += [os.path.join(beam_dir, name)
+                      for name in sorted(os.listdir(beam_dir))
+                      if name.endswith('.py')]
+        digest = hashlib.sha1()
+        for path in paths:
+            digest.update(os.path.basename(path).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _code_version.append(digest.hexdigest())
+    return _code_version[0]
+
+
+def result_key(config):
+    """
+    Cache key of a RunConfig's results: its content digest together
+    with the model code version
+    """
+    return hashlib.sha1(
+        (config.digest + code_version()).encode('utf-8')).hexdigest()
+
+
+class RunCache(object):
+    """
+    Content-addressed store of run_simmod results, keyed by result_key.
+    Recently used results are kept in memory up to memory_bytes, least
+    recently used first out. With a directory, every result is also
+    written there as a compressed .npz of its columns and values, which
+    other processes and later sessions share. The directory is held to
+    disk_bytes by removing the least recently used files, and files not
+    used for max_age seconds are treated as missing and removed. As in
+    memory, a single result larger than the limit is not kept.
+
+    A RunCache sent to another process (e.g. a sweep worker) carries its
+    settings but not its memory tier or statistics.
+    """
+    def __init__(self, directory = None, memory_bytes = 256 * 2**20,
+                 disk_bytes = 4 * 2**30, max_age = None):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age = max_age
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = None           #File sizes by key, scanned on first use
+        self._disk_size = 0
+        self.clear_stats()
+
+    def __getstate__(self):
+        return (self.directory, self.memory_bytes, self.disk_bytes,
+                self.max_age)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return 'RunCache(%r, %r, %r, %r)' % (
+            self.directory, self.memory_bytes, self.disk_bytes, self.max_age)
+
+    def clear_stats(self):
+        """
+        Reset the hit, miss, store and eviction counts
+        """
+        self.stats = dict.fromkeys(
+            ['memory_hits', 'disk_hits', 'misses', 'stores',
+             'memory_evictions', 'disk_evictions'], 0)
+
+    def merge_stats(self, stats):
+        """
+        Add counts gathered by another copy of this cache
+        """
+        for name, count in stats.items():
+            self.stats[name] += count
+
+    def hit_rate(self):
+        """
+        Fraction of lookups answered from either tier
+        """
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        lookups = hits + self.stats['misses']
+        return hits / float(lookups) if lookups else 0.
+
+    def get(self, key):
+        """
+        Cached results for a key as a new DataFrame, or None
+        """
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory[key] = entry
+            self.stats['memory_hits'] += 1
+            return results_frame(*entry)
+
+        entry = self._read(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['disk_hits'] += 1
+        self._remember(key, entry)
+        return results_frame(*entry)
+
+    def put(self, key, results):
+        """
+        Store a results DataFrame under a key in both tiers
+        """
+        entry = (tuple(results.columns),
+                 np.array(results.values, dtype=float))
+        entry[1].flags.writeable = False
+        self._remember(key, entry)
+        self._write(key, entry)
+        self.stats['stores'] += 1
+
+    def clear(self):
+        """
+        Drop every cached result from memory and disk
+        """
+        self._memory.clear()
+        self._memory_size = 0
+        if self.directory is not None and os.path.isdir(self.directory):
+            for key in list(self._scan()):
+                self._remove(key)
+
+    def _remember(self, key, entry):
+        """
+        Add an entry to the memory tier, evicting the least recently
+        used entries beyond memory_bytes
+        """
+        size = entry[1].nbytes
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key)[1].nbytes
+        self._memory[key] = entry
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= evicted[1].nbytes
+            self.stats['memory_evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _read(self, key):
+        """
+        (columns, values) stored on disk for a key, or None when it is
+        missing, expired or unreadable
+        """
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            if (self.max_age is not None and
+                    time.time() - os.path.getmtime(path) > self.max_age):
+                self._remove(key)
+                self.stats['disk_evictions'] += 1
+                return None
+            with np.load(path) as data:
+                entry = (tuple(str(column) for column in data['columns']),
+                         data['values'])
+            #Mark as recently used for disk eviction
+            os.utime(path, None)
+        except Exception:
+            #Missing, or removed or truncated by another process
+            return None
+        entry[1].flags.writeable = False
+        return entry
+
+    def _write(self, key, entry):
+        """
+        Write an entry to disk atomically, unless it alone is larger than
+        disk_bytes, then keep the directory within disk_bytes
+        """
+        if self.directory is None:
+            return
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        if self._disk is None:
+            self._scan()
+        handle, temp = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        with os.fdopen(handle, 'wb') as f:
+            np.savez_compressed(f, columns=np.array(entry[0]), values=entry[1])
+        size = os.path.getsize(temp)
+        if size > self.disk_bytes:
+            os.remove(temp)
+            return
+        os.rename(temp, self._path(key))
+        self._disk_size += size - self._disk.get(key, 0)
+        self._disk[key] = size
+        if self._disk_size > self.disk_bytes:
+            self._evict()
+
+    def _scan(self):
+        """
+        Index the files in the directory by key, removing expired ones
+        """
+        self._disk = {}
+        self._disk_size = 0
+        ages = {}
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz') or name.startswith('tmp'):
+                continue
+            key = name[:-len('.npz')]
+            try:
+                ages[key] = now - os.path.getmtime(self._path(key))
+                self._disk[key] = os.path.getsize(self._path(key))
+            except OSError:
+                ages.pop(key, None)
+                continue
+            self._disk_size += self._disk[key]
+        if self.max_age is not None:
+            for key, age in ages.items():
+                if age > self.max_age:
+                    self._remove(key)
+                    self.stats['disk_evictions'] += 1
+        return ages
+
+    def _evict(self):
+        """
+        Remove the least recently used files until the directory is
+        within disk_bytes, rescanning it first to count files written by
+        other processes
+        """
+        ages = self._scan()
+        for key in sorted(self._disk, key=lambda key: -ages[key]):
+            if self._disk_size <= self.disk_bytes:
+                break
+            self._remove(key)
+            self.stats['disk_evictions'] += 1
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        if self._disk is not None and key in self._disk:
+            self._disk_size -= self._disk.pop(key)
+
+
+def results_frame(columns, values):
+    """
+    run_simmod results DataFrame from cached columns and values
+    """
+    return pd.DataFrame(np.array(values), columns=list(columns))
+
@@ -0,0 +1,153 @@
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from emissions_parser import scenario_fingerprint
+from concs_pulse_decay import gas_kernels
+from impulse_response import FunctionKernel
+
+#run_simmod arguments that set a run's emissions scenario and perturbation
+SCENARIO_FIELDS = ['run_start_year', 'run_end_year', 'dt', 'rcp', 'c_sens',
+                   'add_start', 'add_end', 'c_add', 'ch4_add', 'n2o_add']
+
+#Model settings, named after the simmod_controller globals that default them
+MODEL_FIELDS = ['carbon_model', 'pulse_engine', 'pulse_kernels',
+                'normalize_2000_conc', 'diffusion_engine', 'substeps',
+                'beam_integrator', 'beam_rtol', 'beam_atol',
+                'beam_b_tolerance', 'beam_tabulated_chemistry', 'init_mat',
+                'init_mup', 'init_mlo', 'mixing', 'dz']
+
+#Fields a run resumed from a snapshot must share with the run that took
+#it; the emissions before the snapshot are checked separately
+SETTINGS_FIELDS = ['run_start_year', 'run_end_year', 'dt', 'c_sens'] + \
+    MODEL_FIELDS
+
+#Fields compared by value whatever their numeric type, so that 1 and 1.
+#give the same configuration
+NUMERIC_FIELDS = ['run_start_year', 'run_end_year', 'dt', 'c_sens',
+                  'add_start', 'add_end', 'c_add', 'ch4_add', 'n2o_add',
+                  'substeps', 'beam_rtol', 'beam_atol', 'beam_b_tolerance',
+                  'init_mat', 'init_mup', 'init_mlo', 'dz']
+
+CARBON_MODELS = ['pulse response', 'box diffusion', 'BEAM']
+
+
+class RunConfig(namedtuple('RunConfig',
+                           SCENARIO_FIELDS + MODEL_FIELDS + ['scenario_files'])):
+    """
+    Everything that determines a SimMod run: the emissions scenario and
+    its perturbation, every model setting, and the fingerprint of the
+    scenario files read (see make_config). Configurations are immutable;
+    two are equal, and hash alike, when their contents are, and digest
+    is a content hash that is stable across processes and sessions.
+    """
+    __slots__ = ()
+
+    def canonical(self):
+        """
+        Field values in a comparable form: numbers as floats and
+        kernels as in kernel_key
+        """
+        values = []
+        for name, value in zip(self._fields, self):
+            if name in NUMERIC_FIELDS:
+                value = float(value)
+            elif name == 'pulse_kernels':
+                value = tuple((gas, kernel_key(kernel, self))
+                              for gas, kernel in value)
+            values.append((name, value))
+        return tuple(values)
+
+    def kernel_times(self):
+        """
+        Times (years after a pulse) at which the run samples its kernels
+        """
+        run_years = self.run_end_year - self.run_start_year + 1
+        steps = np.arange(0, run_years, self.dt).shape[0]
+        return np.arange(steps) * self.dt
+
+    @property
+    def digest(self):
+        """
+        SHA-1 hex digest of the configuration's contents
+        """
+        return hashlib.sha1(repr(self.canonical()).encode('utf-8')).hexdigest()
+
+    @property
+    def kernels(self):
+        """
+        pulse_kernels as the dict pulse_decay_runner takes
+        """
+        return dict(self.pulse_kernels)
+
+    def settings(self):
+        """
+        Hashable settings a resumed run must share with its snapshot run
+        """
+        canonical = dict(self.canonical())
+        return tuple(canonical[name] for name in SETTINGS_FIELDS)
+
+    def emissions_args(self):
+        """
+        Positional arguments of emissions_parser.emissions for this run
+        """
+        return [self.run_start_year, self.run_end_year, self.dt, self.rcp,
+                self.add_start, self.add_end, self.c_add, self.ch4_add,
+                self.n2o_add]
+
+    def replace(self, **changes):
+        """
+        Copy with some fields changed, refreshing the scenario file
+        fingerprint when the RCP changes
+        """
+        if 'rcp' in changes and 'scenario_files' not in changes:
+            changes['scenario_files'] = scenario_fingerprint(changes['rcp'])
+        return make_config(**dict(self._asdict(), **changes))
+
+    def __eq__(self, other):
+        return (isinstance(other, RunConfig) and
+                self.canonical() == other.canonical())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.canonical())
+
+
+def kernel_key(kernel, config):
+    """
+    Comparable form of a kernel: its repr, or for a FunctionKernel, whose
+    repr holds the function's address, its response at the times the
+    config's run samples it
+    """
+    if isinstance(kernel, FunctionKernel):
+        times = config.kernel_times()
+        response = np.asarray(kernel.response(times), dtype=float)
+        return ('FunctionKernel',
+                tuple(np.broadcast_to(response, times.shape).tolist()))
+    return repr(kernel)
+
+
+def make_config(**fields):
+    """
+    Build a RunConfig, checking its settings. Every scenario and model
+    field must be given; scenario_files defaults to the fingerprint of
+    the RCP's files. pulse_kernels may be a dict of kernels by gas, or
+    None, and is stored with the defaults filled in.
+    """
+    missing = set(SCENARIO_FIELDS + MODEL_FIELDS) - set(fields)
+    if missing:
+        raise TypeError('Missing run settings: ' + ', '.join(sorted(missing)))
+    unknown = set(fields) - set(RunConfig._fields)
+    if unknown:
+        raise TypeError('Unknown run settings: ' + ', '.join(sorted(unknown)))
+    if fields['carbon_model'] not in CARBON_MODELS:
+        raise ValueError('Unknown carbon model: ' + str(fields['carbon_model']))
+    kernels = fields['pulse_kernels']
+    if kernels is None or isinstance(kernels, dict):
+        fields['pulse_kernels'] = tuple(sorted(gas_kernels(kernels).items()))
+    if fields.get('scenario_files') is None:
+        fields['scenario_files'] = scenario_fingerprint(fields['rcp'])
+    return RunConfig(**fields)
@@ -0,0 +1,105 @@
+import pandas as pd
+import numpy as np
+
+from emissions_parser import emissions
+from simmod_controller import run_config, simulate
+from run_config import RunConfig
+from run_cache import result_key
+
+
+def run_scenarios(scenarios, cache = None):
+    """
+    Run many SimMod scenarios, integrating the history they share once.
+
+    Scenarios with the same run settings form a prefix tree over their
+    emissions: all RCPs share the historical years, and a perturbation
+    shares its RCP up to its start. Each branch point is integrated once
+    by one of its scenarios, which takes a snapshot there, and the other
+    branches are resumed from that snapshot (see simulate). With a
+    RunCache, scenarios it holds are not run, and the results of the
+    others are stored in it as each is simulated.
+
+    Args:
+        :param scenarios: run_simmod keyword arguments, or a RunConfig,
+            for each scenario
+        :type scenarios: list
+        :param cache: Results cache
+        :type cache: RunCache
+
+    Returns:
+        :return: run_simmod results for each scenario, in order
+        :rtype: list
+    """
+    configs = [
+        scenario if isinstance(scenario, RunConfig) else run_config(**scenario)
+        for scenario in scenarios]
+    results = [None] * len(configs)
+    pending = range(len(configs))
+    if cache is not None:
+        keys = [result_key(config) for config in configs]
+        results = [cache.get(key) for key in keys]
+        pending = [i for i in pending if results[i] is None]
+
+    groups = {}
+    for i in pending:
+        groups.setdefault(configs[i].settings(), []).append(i)
+
+    def store(i, result):
+        results[i] = result
+        if cache is not None:
+            cache.put(keys[i], result)
+
+    for members in groups.values():
+        inputs = dict(
+            (i, emissions(*configs[i].emissions_args())) for i in members)
+        years = inputs[members[0]]['year'].values
+        inputs = dict((i, frame.values) for i, frame in inputs.items())
+        run_branch(members, 0, None, configs, inputs, years, store)
+    return results
+
+
+def run_branch(members, start, restore, configs, inputs, years, store):
+    """
+    Run scenarios that share their emissions up to timestep start,
+    resuming from restore (taken at start) when given, and pass each
+    scenario's index and results to store as soon as it is simulated
+    """
+    if len(members) == 1:
+        store(members[0], simulate(configs[members[0]], restore=restore))
+        return
+
+    first = members[0]
+    depth = min(shared_prefix(inputs[first], inputs[i]) for i in members[1:])
+    if depth == len(years):
+        #Identical emissions give identical results
+        result = simulate(configs[first], restore=restore)
+        for i in members:
+            store(i, result.copy())
+        return
+
+    remaining = list(members)
+    if depth > start:
+        result, restore = simulate(configs[first], years[depth], restore)
+        store(first, result)
+        remaining.remove(first)
+        start = depth
+
+    while remaining:
+        branch = [i for i in remaining
+                  if shared_prefix(inputs[remaining[0]], inputs[i]) > depth]
+        remaining = [i for i in remaining if i not in branch]
+        run_branch(branch, start, restore, configs, inputs, years, store)
+
+
+def shared_prefix(a, b):
+    """
+    Number of leading rows two emissions arrays share, counting NaNs in
+    the same places as equal
+    """
+    steps = min(a.shape[0], b.shape[0])
+    a = np.asarray(a[:steps], dtype=float)
+    b = np.asarray(b[:steps], dtype=float)
+    same = ((a == b) | (np.isnan(a) & np.isnan(b))).all(axis=1)
+    if same.all():
+        return steps
+    return int(np.argmin(same))
@@ -2,7 +2,8 @@ import pandas as pd
 import numpy as np
 
 from constants import *
-from simmod_controller import run_simmod
+from sweep import run_sweep
+from run_cache import RunCache
 
 INIT_YEAR = 2016                #Initial year of reductions (inclusive)
 END_YEAR = 2100                 #End year of reductions (inclusive)
@@ -14,40 +15,50 @@ rcp = '2.6'                     #RCP scenario
 carbon_model = 'pulse response' #'pulse response', 'box diffusion', or 'BEAM'
 normalize_2000_conc = True      #Normalize concentrations to historical year-2000 values
 c_sens = 1.25                   #Climate sensativity (T = F / LAMBDA)
+CACHE_DIR = 'cache'             #Directory of cached run results, shared across sessions
 
-def test_co2_reduction(run_start_year, run_end_year, dt, rcp, c_sens):
-    base_run = run_simmod(run_start_year, run_end_year, dt, rcp, c_sens)
-    results = base_run[['year']].copy()
-    for co2_reduc in range(0,205,5):
-        co2_reduc = co2_reduc / 100.
-        for end_year in range (2016, 2101, 1):
-            print co2_reduc,
-            print end_year
-            diffs = (
-                run_simmod(run_start_year, run_end_year, dt, rcp, c_sens, 
-                INIT_YEAR, end_year, co2_reduc, 0, 0)[['year', 't_s']]
-            )
-            diffs['t_s'] =  diffs['t_s'] - base_run['t_s']
-            #diffs.rename(columns={'t_s': 't_s'+str(co2_reduc)}, inplace=True)
-            results.ix[(end_year - 1765), 't_s'+str(co2_reduc)] = diffs['t_s'][END_YEAR - 1765]
-    results.to_csv('Results/co2_sat_target_year_'+rcp+'.csv')
+def co2_reduction_params(point):
+    """
+    run_simmod arguments for a CO2 change from INIT_YEAR to a given end year
+    """
+    return {
+        'rcp': point['rcp'],
+        'add_start': INIT_YEAR,
+        'add_end': point['end_year'],
+        'c_add': point['co2_reduc'],
+    }
 
-test_co2_reduction(run_start_year, run_end_year, dt, '2.6', c_sens)
-test_co2_reduction(run_start_year, run_end_year, dt, '4.5', c_sens)
-test_co2_reduction(run_start_year, run_end_year, dt, '6.0', c_sens)
-test_co2_reduction(run_start_year, run_end_year, dt, '8.5', c_sens)
 
-#def worker():
-#    """worker function"""
-#    print 'Worker'
-#    return
-#
-#if __name__ == '__main__':
-#    jobs = []
-#    for i in range(5):
-#        p = multiprocessing.Process(target=test_co2_reduction)
-#        jobs.append(p)
-#        p.start()
+def test_co2_reduction(run_start_year, run_end_year, dt, rcps, c_sens,
+                       processes = None, cache = None):
+    base = {
+        'run_start_year': run_start_year,
+        'run_end_year': run_end_year,
+        'dt': dt,
+        'c_sens': c_sens,
+        'carbon_model': carbon_model,
+        'normalize_2000_conc': normalize_2000_conc,
+    }
+    reductions = [co2_reduc / 100. for co2_reduc in range(0,205,5)]
+    end_years = range(2016, 2101, 1)
+    year, diffs = run_sweep(
+        [('rcp', rcps), ('co2_reduc', reductions), ('end_year', end_years)],
+        co2_reduction_params, base, processes=processes, cache=cache)
+    rows = [end_year - 1765 for end_year in end_years]
+    for r, rcp in enumerate(rcps):
+        results = pd.DataFrame({'year': year})
+        for c, co2_reduc in enumerate(reductions):
+            column = np.nan * np.ones(year.shape[0])
+            column[rows] = diffs[r, c, :, END_YEAR - 1765]
+            results['t_s'+str(co2_reduc)] = column
+        results.to_csv('Results/co2_sat_target_year_'+rcp+'.csv')
+
+
+if __name__ == '__main__':
+    cache = RunCache(CACHE_DIR)
+    test_co2_reduction(run_start_year, run_end_year, dt,
+                       ['2.6', '4.5', '6.0', '8.5'], c_sens, cache=cache)
+    print('cache: ' + str(cache.stats))
 
 #results = run_simmod(run_start_year, run_end_year, dt, rcp, add_type = 'continuous', add_year = 2000, c_add = 100)
 #results.to_csv('results/simmod_run_'+rcp+' '+carbon_model+'.csv')
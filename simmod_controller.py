@@ -4,10 +4,11 @@ import numpy as np
 from constants import *
 from emissions_parser import emissions
 from concs_pulse_decay import pulse_decay_runner
-from beam_carbon.beam import BEAMCarbon
-beam = BEAMCarbon()
 from radiative_forcing import calc_radiative_forcing
 from heat_diffusion import continuous_diffusion_model
+from checkpoint import take_snapshot, pulse_decay_stage, diffusion_stage
+from run_config import make_config
+from run_cache import result_key
 
 #Model Parameters
 run_start_year = 1765.          #Run start year
@@ -15,11 +16,19 @@ run_end_year = 2100.            #Inclusive of end year
 dt = 1 #/ 100.                  #years
 rcp = '8.5'                     #RCP scenario
 carbon_model = 'pulse response' #'pulse response', 'box diffusion', or 'BEAM'
+pulse_engine = 'recursive'      #'recursive' (single pass), 'fft', or 'loop' (original)
+pulse_kernels = None            #Impulse response kernels by gas; None for Joos et al (1996) CO2 and e-folds
 normalize_2000_conc = True      #Normalize concentrations to historical year-2000 values
 c_sens = 1.25                   #Climate sensativity (T = F / LAMBDA)
+diffusion_engine = 'convolution' #'convolution' or 'implicit' (explicit scheme at 1 year, Crank-Nicolson otherwise), or 'explicit' (original, 1 year only)
 
 #BEAM Model Settings (when relevant)
 SUBSTEPS = 100                  #Break each timestep into this many substeps
+BEAM_INTEGRATOR = 'substeps'    #'substeps' (SUBSTEPS fixed steps), 'exact' (SUBSTEPS exponential steps; a few suffice), or 'adaptive' (error-controlled)
+BEAM_RTOL = 1e-6                #Relative tolerance of the adaptive integrator
+BEAM_ATOL = 1e-3                #Absolute tolerance of the adaptive integrator, GtC
+BEAM_B_TOLERANCE = 1e-4         #Relative change in B before the exact integrator recomputes its matrix exponential
+BEAM_TABULATED_CHEMISTRY = False #Look up k_1, k_2 and k_h by ocean temperature instead of evaluating their fits
 INIT_MAT = 596.                 #In GtC; 596 = preindustrial; 809 = 2005
 INIT_MUP = 713.                 #In GtC; 713 = preindustrial; 725 = 2005
 INIT_MLO = 35625.               #In GtC; 35625 = preindustrial; 35641 = 2005
@@ -28,54 +37,204 @@ INIT_MLO = 35625.               #In GtC; 35625 = preindustrial; 35641 = 2005
 MIXING = 'probable'             #options 'fast', 'slow', or 'probable'
 DZ = 100                        #meters - thickness of each layer in the deep ocean
 
+_beam = None                    #BEAMCarbon shared by BEAM runs, see beam_carbon
+
 
 def run_simmod(run_start_year, run_end_year, dt, rcp, c_sens = c_sens, add_start = 0, 
-               add_end = 0, c_add = 0, ch4_add = 0, n2o_add = 0):
+               add_end = 0, c_add = 0, ch4_add = 0, n2o_add = 0,
+               checkpoint_year = None, restore = None, cache = None,
+               **model):
+    """
+    Run SimMod for an RCP scenario, optionally perturbed by c_add (PgC),
+    ch4_add and n2o_add (Tg) per year from add_start to add_end, and return
+    the results DataFrame of emissions, concentrations, forcing and
+    temperature by timestep.
+
+    Model settings are taken from this module's globals unless given as
+    keyword arguments named as in RunConfig (e.g. carbon_model = 'BEAM');
+    together with the arguments they make the run's RunConfig. With
+    checkpoint_year, returns (results, snapshot), the snapshot holding
+    the model state at the start of that year; passing a snapshot as
+    restore resumes from it (see simulate). With a RunCache as cache,
+    results are looked up there and stored after a miss; runs that take
+    or restore a snapshot bypass the cache.
+    """
+    config = run_config(run_start_year, run_end_year, dt, rcp, c_sens,
+                        add_start, add_end, c_add, ch4_add, n2o_add, **model)
+    if cache is None or checkpoint_year is not None or restore is not None:
+        return simulate(config, checkpoint_year, restore)
+    key = result_key(config)
+    results = cache.get(key)
+    if results is None:
+        results = simulate(config)
+        cache.put(key, results)
+    return results
+
+
+def run_config(run_start_year, run_end_year, dt, rcp, c_sens = c_sens,
+               add_start = 0, add_end = 0, c_add = 0, ch4_add = 0,
+               n2o_add = 0, **model):
+    """
+    RunConfig for a run, with model settings not given in model taken
+    from this module's globals
+    """
+    settings = model_settings()
+    settings.update(model)
+    return make_config(
+        run_start_year=run_start_year, run_end_year=run_end_year, dt=dt,
+        rcp=rcp, c_sens=c_sens, add_start=add_start, add_end=add_end,
+        c_add=c_add, ch4_add=ch4_add, n2o_add=n2o_add, **settings)
+
+
+def model_settings():
     """
-    Run the various parts of SimMod and export images and CSV files.
+    Model settings from this module's globals, by RunConfig field
     """
-    run_years = (run_end_year - run_start_year + 1)
-    emission_vals = emissions(run_start_year, run_end_year, dt, rcp, 
-                              add_start, add_end, c_add, ch4_add, n2o_add)
-    conc = pulse_decay_runner(run_years, dt, emission_vals)
-
-    if carbon_model == 'BEAM':
-        beam._initial_carbon = np.array([596., 713., 35625.])
-        beam.intervals = SUBSTEPS
-        beam.time_step = dt
-        beam.emissions = emission_vals['co2_pg'] / C_TO_CO2
-        beam_results = pd.melt(beam.run()[0:1])
-        conc['co2_ppm'] = beam_results['value'] * PGC_TO_MOL * 1e6 / MOLES_IN_ATMOSPHERE
-
-    if carbon_model == 'box diffusion':
+    return {
+        'carbon_model': carbon_model,
+        'pulse_engine': pulse_engine,
+        'pulse_kernels': pulse_kernels,
+        'normalize_2000_conc': normalize_2000_conc,
+        'diffusion_engine': diffusion_engine,
+        'substeps': SUBSTEPS,
+        'beam_integrator': BEAM_INTEGRATOR,
+        'beam_rtol': BEAM_RTOL,
+        'beam_atol': BEAM_ATOL,
+        'beam_b_tolerance': BEAM_B_TOLERANCE,
+        'beam_tabulated_chemistry': BEAM_TABULATED_CHEMISTRY,
+        'init_mat': INIT_MAT,
+        'init_mup': INIT_MUP,
+        'init_mlo': INIT_MLO,
+        'mixing': MIXING,
+        'dz': DZ,
+    }
+
+
+def simulate(config, checkpoint_year = None, restore = None):
+    """
+    Run SimMod for a RunConfig.
+
+    With checkpoint_year, returns (results, snapshot) where snapshot is
+    the model state at the start of that year. Passing a snapshot as
+    restore resumes the run from its year, e.g. a perturbed run from a
+    baseline snapshot taken at add_start; the run must share the
+    snapshot run's settings and its emissions before that year.
+    """
+    dt = config.dt
+    run_years = (config.run_end_year - config.run_start_year + 1)
+    emission_vals = emissions(*config.emissions_args())
+
+    settings = config.settings()
+    if restore is not None:
+        restore.check(emission_vals, settings)
+    snapshot = None
+    if checkpoint_year is not None:
+        snapshot = take_snapshot(emission_vals, checkpoint_year, settings)
+        if restore is not None and snapshot.index < restore.index:
+            raise ValueError('Cannot take a snapshot before the restored year')
+
+    if config.pulse_engine == 'loop' or (restore is None and snapshot is None):
+        conc = pulse_decay_runner(run_years, dt, emission_vals,
+                                  config.pulse_engine, config.kernels)
+    else:
+        conc = pulse_decay_stage(emission_vals, dt, config.kernels,
+                                 config.pulse_engine == 'fft', restore,
+                                 snapshot)
+
+    if config.carbon_model == 'BEAM':
+        conc['co2_ppm'] = beam_co2_ppm(config, emission_vals, restore,
+                                       snapshot)
+
+    if config.carbon_model == 'box diffusion':
+        from box_diffusion import box_diffusion_model
         box_diffusion_results = box_diffusion_model(
             emission_vals, 
             dt, 
-            DZ, 
-            MIXING
+            config.dz, 
+            config.mixing
         )
         conc['co2_ppm'] = box_diffusion_results['co2ppm']
 
-    if normalize_2000_conc == True:
-        conc['co2_ppm'] = (
-            conc['co2_ppm'] - 
-            conc.loc[conc['year'] == 2000, 'co2_ppm'].min() +
-            emission_vals.loc[emission_vals['year'] == 2000, 'rcp_co2_ppm'].min()
-        )
-        conc['ch4_ppb'] = (
-            conc['ch4_ppb'] - 
-            conc.loc[conc['year'] == 2000, 'ch4_ppb'].min() +
-            emission_vals.loc[emission_vals['year'] == 2000, 'rcp_ch4_ppb'].min()
-        )
-        conc['n2o_ppb'] = (
-            conc['n2o_ppb'] - 
-            conc.loc[conc['year'] == 2000, 'n2o_ppb'].min() +
-            emission_vals.loc[emission_vals['year'] == 2000, 'rcp_n2o_ppb'].min()
-        )
+    if config.normalize_2000_conc == True:
+        offsets = None if restore is None else restore.offsets
+        if offsets is None:
+            offsets = normalization_offsets(conc, emission_vals)
+        for column, (conc_2000, rcp_2000) in sorted(offsets.items()):
+            conc[column] = conc[column] - conc_2000 + rcp_2000
+        if snapshot is not None and (
+                conc['year'].values[snapshot.index:] > 2000).all():
+            snapshot.offsets = offsets
 
     forcing = calc_radiative_forcing(conc)
-    warming = continuous_diffusion_model(forcing, run_years, dt, c_sens)
+    diffusion_engine = config.diffusion_engine
+    if diffusion_engine == 'explicit' or (restore is None and snapshot is None):
+        warming = continuous_diffusion_model(forcing, run_years, dt,
+                                             config.c_sens, diffusion_engine)
+    else:
+        warming = diffusion_stage(forcing, dt, config.c_sens,
+                                  diffusion_engine == 'convolution',
+                                  restore=restore, snapshot=snapshot)
+    if checkpoint_year is not None:
+        return warming, snapshot
     return warming
 
-results = run_simmod(run_start_year, run_end_year, dt, rcp, c_sens)
-results.to_csv('results/simmod_run_'+rcp+' '+carbon_model+'.csv')
\ No newline at end of file
+
+def beam_co2_ppm(config, emission_vals, restore = None, snapshot = None):
+    """
+    Atmospheric CO2 (ppm) at the start of each timestep from BEAM,
+    resuming from the BEAM state in restore and recording it in snapshot
+    """
+    beam = beam_carbon()
+    beam._initial_carbon = np.array(
+        [config.init_mat, config.init_mup, config.init_mlo], dtype=float)
+    beam.intervals = config.substeps
+    beam.time_step = config.dt
+    beam.tabulated_chemistry = config.beam_tabulated_chemistry
+    beam.emissions = emission_vals['co2_pg'] / C_TO_CO2
+    beam_state = None if restore is None else restore.beam
+    beam_checkpoint = None if snapshot is None else snapshot.index
+    if config.beam_integrator == 'adaptive':
+        beam_output = beam.run_adaptive(config.beam_rtol, config.beam_atol,
+                                        beam_state, beam_checkpoint)
+    elif config.beam_integrator == 'exact':
+        beam_output = beam.run_exact(config.beam_b_tolerance, beam_state,
+                                     beam_checkpoint)
+    else:
+        beam_output = beam.run_array(beam_state, beam_checkpoint)
+    mass_atmosphere = beam_output[0, :-1]
+    if snapshot is not None:
+        snapshot.beam = beam.checkpoint_state
+    return mass_atmosphere * PGC_TO_MOL * 1e6 / MOLES_IN_ATMOSPHERE
+
+
+def beam_carbon():
+    """
+    BEAMCarbon instance shared by BEAM runs in this process. BEAM is only
+    imported when the first one needs it.
+    """
+    global _beam
+    if _beam is None:
+        from beam_carbon.beam import BEAMCarbon
+        _beam = BEAMCarbon()
+    return _beam
+
+
+def normalization_offsets(conc, emission_vals):
+    """
+    Modelled and RCP year-2000 concentrations that normalization moves
+    each concentration column between
+    """
+    in_2000 = conc['year'] == 2000
+    return {
+        'co2_ppm': (conc.loc[in_2000, 'co2_ppm'].min(),
+                    emission_vals.loc[in_2000, 'rcp_co2_ppm'].min()),
+        'ch4_ppb': (conc.loc[in_2000, 'ch4_ppb'].min(),
+                    emission_vals.loc[in_2000, 'rcp_ch4_ppb'].min()),
+        'n2o_ppb': (conc.loc[in_2000, 'n2o_ppb'].min(),
+                    emission_vals.loc[in_2000, 'rcp_n2o_ppb'].min()),
+    }
+
+
+if __name__ == '__main__':
+    results = run_simmod(run_start_year, run_end_year, dt, rcp, c_sens)
+    results.to_csv('results/simmod_run_'+rcp+' '+carbon_model+'.csv')
\ No newline at end of file
@@ -0,0 +1,133 @@
+import itertools
+import multiprocessing
+
+import pandas as pd
+import numpy as np
+
+from scenario_tree import run_scenarios
+
+#run_simmod arguments that describe an emission perturbation; a run with
+#these removed is the baseline it is compared against
+PERTURBATION_ARGS = ['add_start', 'add_end', 'c_add', 'ch4_add', 'n2o_add']
+
+#Most runs in a chunk, whose full results are held until it finishes
+MAX_CHUNKSIZE = 16
+
+
+def run_sweep(axes, params, base, output = 't_s', processes = None,
+              chunksize = None, cache = None):
+    """
+    Run a grid of perturbed SimMod runs and difference each against its
+    baseline.
+
+    Args:
+        :param axes: Grid axes as (name, values) pairs
+        :type axes: list
+        :param params: Function taking a dict of one value per axis and
+            returning run_simmod keyword arguments for that grid point
+        :type params: function
+        :param base: run_simmod keyword arguments shared by every run
+            (run_start_year, run_end_year, dt, rcp, c_sens, ...)
+        :type base: dict
+        :param output: run_simmod results column to difference
+        :type output: str
+        :param processes: Worker processes; 1 runs serially in this
+            process, None uses one per CPU
+        :type processes: int
+        :param chunksize: Runs handed to a worker at a time, which share
+            their common history (see run_scenarios); by default about
+            four chunks per worker, and at most MAX_CHUNKSIZE runs
+        :type chunksize: int
+        :param cache: Results cache shared by the workers through its
+            directory; their hit and miss counts are added to it
+        :type cache: RunCache
+
+    Returns:
+        :return: (year, diffs), with diffs indexed by the grid axes in
+            order and then by timestep
+        :rtype: tuple
+    """
+    names = [name for name, _ in axes]
+    points = list(itertools.product(*[axis_values for _, axis_values in axes]))
+    runs = []
+    for point in points:
+        kwargs = dict(base)
+        kwargs.update(params(dict(zip(names, point))))
+        runs.append(kwargs)
+
+    baselines = []
+    baseline_index = {}
+    run_baselines = []
+    for kwargs in runs:
+        key = baseline_key(kwargs)
+        if key not in baseline_index:
+            baseline_index[key] = len(baselines)
+            baselines.append(dict(key))
+        run_baselines.append(baseline_index[key])
+
+    #Runs sharing a baseline are kept together so that each chunk of runs
+    #can share its common history
+    tasks = baselines + runs
+    order = sorted(range(len(tasks)), key=lambda i: baseline_key(tasks[i]))
+    if chunksize is None:
+        workers = 1 if processes == 1 else (
+            processes or multiprocessing.cpu_count())
+        chunksize = max(1, min(MAX_CHUNKSIZE, len(tasks) // (4 * workers)))
+    starts = range(0, len(order), chunksize)
+    chunks = (
+        ([tasks[i] for i in order[start:start + chunksize]], output, cache)
+        for start in starts
+    )
+
+    #Each chunk is reduced to its output columns as soon as it finishes
+    values = [None] * len(tasks)
+    pool = None
+    if processes == 1:
+        chunk_results = itertools.imap(sweep_task, chunks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        chunk_results = pool.imap(sweep_task, chunks)
+    try:
+        for start, (chunk_values, stats) in itertools.izip(
+                starts, chunk_results):
+            for i, value in zip(order[start:start + chunksize], chunk_values):
+                values[i] = value
+            if pool is not None and cache is not None:
+                cache.merge_stats(stats)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    year = values[0][0]
+    baseline_values = [value for _, value in values[:len(baselines)]]
+    diffs = np.array([
+        value - baseline_values[b]
+        for (_, value), b in zip(values[len(baselines):], run_baselines)
+    ])
+    shape = [len(axis_values) for _, axis_values in axes]
+    return year, diffs.reshape(shape + [year.shape[0]])
+
+
+def sweep_task(task):
+    """
+    Run a chunk of sweep members, sharing their common history, and
+    return the year and output columns of each, with the cache
+    statistics of the chunk
+    """
+    scenarios, output, cache = task
+    values = [
+        (results['year'].values, results[output].values)
+        for results in run_scenarios(scenarios, cache)
+    ]
+    return values, None if cache is None else cache.stats
+
+
+def baseline_key(kwargs):
+    """
+    Hashable run_simmod arguments of the unperturbed run for a member
+    """
+    return tuple(sorted(
+        (name, value) for name, value in kwargs.items()
+        if name not in PERTURBATION_ARGS
+    ))
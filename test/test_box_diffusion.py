@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from box_diffusion import MIXING_DIFFUSIVITY, box_diffusion_ensemble, box_operator
+from box_diffusion_bias_analysis import box_diffusion_bias
+from constants import C_TO_CO2
+
+PRESETS = sorted(MIXING_DIFFUSIVITY, key=MIXING_DIFFUSIVITY.get)
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+def ocean_carbon(results):
+    return (results['c_atm_pg'] + results['c_mixed_pg'] +
+            results['c_deep_pg'])
+
+
+class BoxDiffusionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.emissions = np.concatenate((
+            np.random.RandomState(0).rand(150) * 40., np.zeros(100)))
+
+    def test_zero_emissions_stay_at_equilibrium(self):
+        for mixing in PRESETS:
+            results = box_diffusion_ensemble(np.zeros(200), 1, 100, mixing,
+                                             280.)
+            self.failUnlessEqual(0., np.abs(ocean_carbon(results)).max())
+            np.testing.assert_array_equal(results['co2ppm'], 280.)
+
+    def test_carbon_is_conserved(self):
+        added = np.cumsum(self.emissions) / C_TO_CO2
+        for dt in [1, 0.5]:
+            for theta in [0.5, 1.]:
+                for mixing in PRESETS:
+                    results = box_diffusion_ensemble(self.emissions, dt, 100,
+                                                     mixing, theta=theta)
+                    np.testing.assert_allclose(
+                        ocean_carbon(results), added, rtol=1e-10)
+
+    def test_faster_mixing_takes_up_more_carbon(self):
+        co2ppm = [box_diffusion_ensemble(self.emissions, 1, 100,
+                                         mixing)['co2ppm'][-1]
+                  for mixing in PRESETS]
+        self.failUnless(co2ppm[0] > co2ppm[1] > co2ppm[2])
+
+    def test_ensemble_rows_match_single_runs(self):
+        emissions = np.array([self.emissions, 0.5 * self.emissions,
+                              self.emissions[::-1]])
+        co2_0 = np.array([278., 280., 285.])
+        ensemble = box_diffusion_ensemble(emissions, 1, 100, PRESETS, co2_0)
+        for i, mixing in enumerate(PRESETS):
+            single = box_diffusion_ensemble(emissions[i], 1, 100, mixing,
+                                            co2_0[i])
+            for name, values in single.items():
+                np.testing.assert_allclose(ensemble[name][i], values,
+                                           rtol=1e-12, atol=1e-12)
+
+    def test_unknown_mixing(self):
+        self.assertRaises(ValueError, box_operator, 1, 100, 'medium')
+
+    def test_rcp_bias(self):
+        #As stated in the README
+        bias = box_diffusion_bias(['2.6', '4.5', '6.0', '8.5'])
+        self.failUnless((np.abs(bias['bias'][:3]) < 3.).all())
+        self.failUnlessEqual(889, round(bias['co2_ppm'][3]))
+        self.failUnlessEqual(936, round(bias['rcp_co2_ppm'][3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
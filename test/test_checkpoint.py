@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'beam_model'))
+from simmod_controller import run_simmod
+
+BASELINE = (1765., 2100., 1, '8.5', 1.25)
+PERTURBATION = (2030, 2060, -1, -50, -5)
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+class RestoreTest(unittest.TestCase):
+
+    def assert_same_results(self, expected, actual):
+        self.failUnlessEqual(list(expected.columns), list(actual.columns))
+        np.testing.assert_allclose(actual.values.astype(float),
+                                   expected.values.astype(float),
+                                   rtol=1e-10, atol=1e-10)
+
+    def assert_restore_matches_full_run(self, dt = 1, **model):
+        baseline = BASELINE[:2] + (dt,) + BASELINE[3:]
+        _, snapshot = run_simmod(*baseline, checkpoint_year=2030, **model)
+        full = run_simmod(*baseline + PERTURBATION, **model)
+        resumed = run_simmod(*baseline + PERTURBATION, restore=snapshot,
+                             **model)
+        self.assert_same_results(full, resumed)
+
+        #A snapshot taken by a resumed run resumes in turn
+        _, later = run_simmod(*baseline + PERTURBATION, checkpoint_year=2050,
+                              restore=snapshot, **model)
+        chained = run_simmod(*baseline + PERTURBATION, restore=later, **model)
+        self.assert_same_results(full, chained)
+
+    def test_pulse_engines(self):
+        for engine in ['recursive', 'fft', 'loop']:
+            self.assert_restore_matches_full_run(pulse_engine=engine)
+
+    def test_diffusion_engines(self):
+        for engine in ['convolution', 'implicit', 'explicit']:
+            self.assert_restore_matches_full_run(diffusion_engine=engine)
+
+    def test_diffusion_engines_half_year(self):
+        for engine in ['convolution', 'implicit']:
+            self.assert_restore_matches_full_run(dt=0.5,
+                                                 diffusion_engine=engine)
+
+    def test_carbon_models(self):
+        self.assert_restore_matches_full_run(carbon_model='box diffusion')
+        for integrator in ['substeps', 'exact', 'adaptive']:
+            self.assert_restore_matches_full_run(
+                carbon_model='BEAM', beam_integrator=integrator, substeps=10)
+
+    def test_restore_rejects_different_history(self):
+        _, snapshot = run_simmod(*BASELINE, checkpoint_year=2030)
+        self.assertRaises(ValueError, run_simmod,
+                          *BASELINE + (2020, 2060, -1), restore=snapshot)
+        self.assertRaises(ValueError, run_simmod, *BASELINE + PERTURBATION,
+                          restore=snapshot, diffusion_engine='implicit')
+
+
+if __name__ == '__main__':
+    unittest.main()
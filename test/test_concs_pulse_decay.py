@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from concs_pulse_decay import pulse_decay_batch, pulse_decay_runner
+from emissions_parser import emissions
+
+RUN_START_YEAR = 1765.
+RUN_END_YEAR = 2060.
+PERTURBATIONS = [(0, 0, 0, 0, 0), (2020, 2040, -1, -50, -5)]
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+class PulseDecayEnginesTest(unittest.TestCase):
+
+    def assert_engines_match_loop(self, dt):
+        run_years = RUN_END_YEAR - RUN_START_YEAR + 1
+        for rcp in ['2.6', '8.5']:
+            for perturbation in PERTURBATIONS:
+                emission_vals = emissions(RUN_START_YEAR, RUN_END_YEAR, dt,
+                                          rcp, *perturbation)
+                loop = pulse_decay_runner(run_years, dt, emission_vals.copy(),
+                                          'loop')
+                for engine in ['recursive', 'fft']:
+                    conc = pulse_decay_runner(run_years, dt,
+                                              emission_vals.copy(), engine)
+                    for column in ['co2_ppm', 'ch4_ppb', 'n2o_ppb']:
+                        np.testing.assert_allclose(
+                            conc[column].values, loop[column].values,
+                            rtol=1e-12, atol=1e-9,
+                            err_msg=str((rcp, perturbation, engine, column)))
+
+    def test_engines_match_loop(self):
+        self.assert_engines_match_loop(1)
+
+    def test_engines_match_loop_half_year(self):
+        self.assert_engines_match_loop(0.5)
+
+
+class PulseDecayBatchTest(unittest.TestCase):
+
+    def test_batch_matches_runner(self):
+        dt = 1
+        run_years = RUN_END_YEAR - RUN_START_YEAR + 1
+        frames = [emissions(RUN_START_YEAR, RUN_END_YEAR, dt, rcp,
+                            *perturbation)
+                  for rcp in ['2.6', '8.5'] for perturbation in PERTURBATIONS]
+
+        def members(column):
+            return np.array([frame[column].values for frame in frames])
+
+        batch = pulse_decay_batch(
+            dt, members('co2_pg'), members('ch4_tg'), members('n2o_tg'),
+            members('rcp_co2_ppm')[:, :1], members('rcp_ch4_ppb')[:, :1],
+            members('rcp_n2o_ppb')[:, :1])
+        for i, frame in enumerate(frames):
+            conc = pulse_decay_runner(run_years, dt, frame.copy(), 'recursive')
+            for column in ['co2_ppm', 'ch4_ppb', 'n2o_ppb']:
+                np.testing.assert_allclose(batch[column][i],
+                                           conc[column].values,
+                                           rtol=1e-12, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
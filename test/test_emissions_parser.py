@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from emissions_parser import emissions, emissions_loop
+
+PERTURBATIONS = [
+    {},
+    {'add_start': 2020, 'add_end': 2040, 'c_add': -1},
+    {'add_start': 2005.5, 'add_end': 2030.25, 'c_add': 2, 'ch4_add': -50,
+     'n2o_add': -5},
+]
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+class EmissionsTest(unittest.TestCase):
+
+    def assert_same_frame(self, expected, actual, message):
+        self.failUnlessEqual(list(expected.columns), list(actual.columns))
+        for column in expected.columns:
+            a = actual[column].values.astype(float)
+            b = expected[column].values.astype(float)
+            self.failUnless(
+                ((a == b) | (np.isnan(a) & np.isnan(b))).all(),
+                message + ' differ in ' + column)
+
+    def test_matches_loop(self):
+        #The loop is slow at fine timesteps, so those run one scenario
+        for dt, rcps in [(1, ['2.6', '8.5']), (0.25, ['8.5']),
+                         (1 / 3., ['8.5'])]:
+            for rcp in rcps:
+                for perturbation in PERTURBATIONS:
+                    args = (1765., 2060., dt, rcp)
+                    self.assert_same_frame(
+                        emissions_loop(*args, **perturbation),
+                        emissions(*args, **perturbation),
+                        str((dt, rcp, perturbation)))
+
+
+if __name__ == '__main__':
+    unittest.main()
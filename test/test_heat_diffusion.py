@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from heat_diffusion import continuous_diffusion_model, solve_tridiagonal, verify_step_response
+from simmod_controller import run_simmod
+
+CLIM_SENS = 1.25
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+def forcing_frame(rcp, dt):
+    results = run_simmod(1765., 2100., dt, rcp, CLIM_SENS)
+    return results[['year', 'total_forcing']].copy()
+
+
+class ImplicitDiffusionTest(unittest.TestCase):
+
+    def test_implicit_matches_explicit_at_one_year(self):
+        for rcp in ['2.6', '8.5']:
+            forcing = forcing_frame(rcp, 1)
+            run_years = forcing.shape[0]
+            explicit = continuous_diffusion_model(
+                forcing.copy(), run_years, 1, CLIM_SENS, 'explicit')
+            for theta in [None, 0.]:
+                implicit = continuous_diffusion_model(
+                    forcing.copy(), run_years, 1, CLIM_SENS, 'implicit',
+                    theta)
+                for column in ['t_os', 't_s']:
+                    np.testing.assert_allclose(
+                        implicit[column].values, explicit[column].values,
+                        rtol=0, atol=1e-12)
+
+    def test_solve_tridiagonal_matches_dense_solve(self):
+        random = np.random.RandomState(0)
+        size = 20
+        lower = random.rand(size)
+        upper = random.rand(size)
+        lower[0] = 0.
+        upper[-1] = 0.
+        diag = 2.5 + random.rand(size)
+        dense = (np.diag(diag) + np.diag(lower[1:], -1) +
+                 np.diag(upper[:-1], 1))
+        for rhs in [random.rand(size), random.rand(size, 3)]:
+            np.testing.assert_allclose(
+                solve_tridiagonal(lower, diag, upper, rhs),
+                np.linalg.solve(dense, rhs), rtol=1e-12, atol=1e-14)
+
+
+class ConvolutionTest(unittest.TestCase):
+
+    def test_step_response_matches_time_stepping(self):
+        for dt in [1, 0.5]:
+            forcing = forcing_frame('8.5', dt)['total_forcing'].values
+            ensemble = np.array([forcing, 0.5 * forcing, -forcing])
+            for theta in [0., 0.5, 1.]:
+                verify_step_response(forcing, dt, CLIM_SENS, theta)
+                verify_step_response(ensemble, dt, CLIM_SENS, theta)
+
+    def test_convolution_matches_implicit(self):
+        for dt in [1, 0.5]:
+            for rcp in ['2.6', '8.5']:
+                forcing = forcing_frame(rcp, dt)
+                run_years = 2100 - 1765 + 1
+                implicit = continuous_diffusion_model(
+                    forcing.copy(), run_years, dt, CLIM_SENS, 'implicit')
+                convolution = continuous_diffusion_model(
+                    forcing.copy(), run_years, dt, CLIM_SENS, 'convolution')
+                for column in ['t_os', 't_s']:
+                    np.testing.assert_allclose(
+                        convolution[column].values, implicit[column].values,
+                        rtol=0, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from constants import C_TO_CO2
+from perturbation_response import PerturbationResponse
+from simmod_controller import run_simmod
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+class PerturbationResponseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baseline = run_simmod(1765., 2100., 1, '8.5', 1.25)
+        cls.response = PerturbationResponse(cls.baseline, 1, 1.25)
+
+    def test_error_bound_covers_linearization_error(self):
+        perturbations = [
+            (2020, 2040, -1, 0, 0),
+            (1900, 1950, 5, 0, 0),
+            (2016, 2100, -2, 0, 0),
+            (2001, 2051, 0, -C_TO_CO2 * 1000 / 34., 0),
+            (2050, 2060, 0, 0, -C_TO_CO2 * 1000 / 298.),
+            (1990, 2010, -3, 100, 2),
+        ]
+        for args in perturbations:
+            profile = self.response.profile(*args)
+            error = np.abs(self.response.delta_t_s(**profile) -
+                           self.response.exact_response(**profile))
+            bound = self.response.error_bound(**profile)
+            #Allowing for rounding in the FFT convolutions
+            self.assertTrue(np.all(bound + 1e-12 >= error), args)
+
+    def test_evaluate_reruns_members_over_tolerance(self):
+        profile = self.response.profile(1900, 1950, 5)
+        delta, bound, flagged = self.response.evaluate(
+            tolerance=1e-3, **profile)
+        self.assertTrue(flagged)
+        np.testing.assert_allclose(
+            delta, self.response.exact_response(**profile), atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
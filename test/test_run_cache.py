@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from run_cache import RunCache
+
+
+def frame(seed, rows = 100):
+    return pd.DataFrame(np.random.RandomState(seed).rand(rows, 4),
+                        columns=['year', 'co2_ppm', 't_os', 't_s'])
+
+
+class RunCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.entry_bytes = frame(0).values.nbytes
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def file_size(self, cache, key):
+        return os.path.getsize(cache._path(key))
+
+    def set_age(self, cache, key, seconds):
+        used = time.time() - seconds
+        os.utime(cache._path(key), (used, used))
+
+    def test_memory_evicts_least_recently_used(self):
+        cache = RunCache(memory_bytes=2 * self.entry_bytes)
+        cache.put('a', frame(0))
+        cache.put('b', frame(1))
+        cache.get('a')
+        cache.put('c', frame(2))
+        self.failUnlessEqual(1, cache.stats['memory_evictions'])
+        self.failUnless(cache.get('b') is None)
+        np.testing.assert_array_equal(frame(0).values, cache.get('a').values)
+        np.testing.assert_array_equal(frame(2).values, cache.get('c').values)
+
+    def test_memory_skips_oversize_entry(self):
+        cache = RunCache(memory_bytes=self.entry_bytes)
+        cache.put('a', frame(0))
+        cache.put('big', frame(1, rows=200))
+        self.failUnless(cache.get('big') is None)
+        self.failUnlessEqual(0, cache.stats['memory_evictions'])
+        self.failIf(cache.get('a') is None)
+
+    def test_get_returns_a_copy(self):
+        cache = RunCache()
+        cache.put('a', frame(0))
+        cache.get('a')['t_s'] = 0.
+        np.testing.assert_array_equal(frame(0).values, cache.get('a').values)
+
+    def test_disk_evicts_least_recently_used(self):
+        cache = RunCache(self.directory, memory_bytes=0)
+        for i, key in enumerate(['a', 'b']):
+            cache.put(key, frame(i))
+            self.set_age(cache, key, 100 - i)
+        cache.get('a')
+        cache.disk_bytes = (self.file_size(cache, 'a') +
+                            self.file_size(cache, 'b') +
+                            self.file_size(cache, 'b') // 2)
+        cache.put('c', frame(2))
+        self.failUnlessEqual(1, cache.stats['disk_evictions'])
+        self.failIf(os.path.exists(cache._path('b')))
+        self.failUnless(cache.get('b') is None)
+        np.testing.assert_array_equal(frame(0).values, cache.get('a').values)
+        np.testing.assert_array_equal(frame(2).values, cache.get('c').values)
+
+    def test_disk_skips_oversize_entry(self):
+        cache = RunCache(self.directory, memory_bytes=0)
+        cache.put('a', frame(0))
+        cache.disk_bytes = self.file_size(cache, 'a') * 3 // 2
+        cache.put('big', frame(1, rows=1000))
+        self.failIf(os.path.exists(cache._path('big')))
+        self.failUnlessEqual(0, cache.stats['disk_evictions'])
+        self.failIf(cache.get('a') is None)
+        self.failUnlessEqual(['a.npz'], os.listdir(self.directory))
+
+    def test_disk_removes_aged_entries(self):
+        cache = RunCache(self.directory, memory_bytes=0, max_age=60)
+        cache.put('a', frame(0))
+        cache.put('b', frame(1))
+        self.set_age(cache, 'a', 120)
+        self.failUnless(cache.get('a') is None)
+        self.failUnlessEqual(1, cache.stats['disk_evictions'])
+        self.failIf(os.path.exists(cache._path('a')))
+        self.failIf(cache.get('b') is None)
+
+        #Expired files are also removed when another cache scans them
+        self.set_age(cache, 'b', 120)
+        other = RunCache(self.directory, max_age=60)
+        other.put('c', frame(2))
+        self.failUnlessEqual(1, other.stats['disk_evictions'])
+        self.failUnlessEqual(['c.npz'], os.listdir(self.directory))
+
+    def test_round_trip_across_processes(self):
+        script = (
+            'import sys; sys.path.insert(0, %r); sys.path.insert(0, %r)\n'
+            'from test_run_cache import frame\n'
+            'from run_cache import RunCache\n'
+            'cache = RunCache(%r)\n'
+            'cache.put("a", frame(0))\n'
+            'assert cache.get("b").equals(frame(1))\n'
+        ) % (ROOT, os.path.dirname(os.path.abspath(__file__)), self.directory)
+        RunCache(self.directory).put('b', frame(1))
+        subprocess.check_call([sys.executable, '-c', script])
+        cache = RunCache(self.directory)
+        result = cache.get('a')
+        self.failUnlessEqual(1, cache.stats['disk_hits'])
+        self.failUnless(result.equals(frame(0)))
+        self.failUnlessEqual(list(frame(0).columns), list(result.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from run_cache import RunCache
+from scenario_tree import run_scenarios
+from simmod_controller import run_simmod
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+def scenarios():
+    base = dict(run_start_year=1765, run_end_year=2100, dt=1)
+    runs = []
+    for rcp in ['2.6', '8.5']:
+        runs.append(dict(base, rcp=rcp))
+        for start in [2010, 2030, 2050]:
+            runs.append(dict(base, rcp=rcp, add_start=start,
+                             add_end=start + 20, c_add=-1))
+            runs.append(dict(base, rcp=rcp, add_start=start,
+                             add_end=start + 20, ch4_add=-30, n2o_add=-2))
+    #A duplicate, other settings and another timestep form their own groups
+    runs.append(dict(base, rcp='8.5'))
+    runs.append(dict(base, rcp='8.5', c_sens=1.5, add_start=2030,
+                     add_end=2050, c_add=-1))
+    runs.append(dict(base, rcp='8.5', dt=0.5, add_start=2050, add_end=2060,
+                     ch4_add=-30))
+    return runs
+
+
+class RunScenariosTest(unittest.TestCase):
+
+    def assert_same_results(self, expected, actual):
+        self.failUnlessEqual(len(expected), len(actual))
+        for a, b in zip(expected, actual):
+            self.failUnlessEqual(list(a.columns), list(b.columns))
+            np.testing.assert_allclose(b.values.astype(float),
+                                       a.values.astype(float),
+                                       rtol=1e-10, atol=1e-10)
+
+    def test_matches_independent_runs(self):
+        runs = scenarios()
+        self.assert_same_results([run_simmod(**kwargs) for kwargs in runs],
+                                 run_scenarios(runs))
+
+    def test_box_diffusion_matches_independent_runs(self):
+        runs = [dict(kwargs, carbon_model='box diffusion')
+                for kwargs in scenarios()[:4]]
+        self.assert_same_results([run_simmod(**kwargs) for kwargs in runs],
+                                 run_scenarios(runs))
+
+    def test_cache_reuses_results(self):
+        directory = tempfile.mkdtemp()
+        try:
+            runs = scenarios()
+            first = run_scenarios(runs, RunCache(directory))
+            cache = RunCache(directory)
+            second = run_scenarios(runs, cache)
+            self.failUnlessEqual(0, cache.stats['misses'])
+            self.assert_same_results(first, second)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from simmod_controller import run_simmod
+from sweep import run_sweep
+
+AXES = [('rcp', ['4.5', '8.5']), ('start', [2010, 2040, 2070]),
+        ('c_add', [-1., -2.])]
+BASE = dict(run_start_year=1765, run_end_year=2100, dt=1, c_sens=1.25)
+
+
+def setUpModule():
+    os.chdir(ROOT)
+
+
+def params(point):
+    return dict(rcp=point['rcp'], add_start=point['start'], add_end=2100,
+                c_add=point['c_add'])
+
+
+class RunSweepTest(unittest.TestCase):
+
+    def test_matches_independent_runs(self):
+        year, diffs = run_sweep(AXES, params, BASE, processes=1)
+        self.failUnlessEqual((2, 3, 2, 336), diffs.shape)
+        for i, rcp in enumerate(AXES[0][1]):
+            baseline = run_simmod(rcp=rcp, **BASE)
+            np.testing.assert_array_equal(baseline['year'].values, year)
+            for j, start in enumerate(AXES[1][1]):
+                for k, c_add in enumerate(AXES[2][1]):
+                    run = run_simmod(add_start=start, add_end=2100,
+                                     c_add=c_add, rcp=rcp, **BASE)
+                    np.testing.assert_allclose(
+                        diffs[i, j, k],
+                        run['t_s'].values - baseline['t_s'].values,
+                        rtol=0, atol=1e-10)
+
+    def test_serial_matches_pooled(self):
+        serial = run_sweep(AXES, params, BASE, processes=1, chunksize=3)
+        pooled = run_sweep(AXES, params, BASE, processes=2)
+        np.testing.assert_array_equal(serial[0], pooled[0])
+        np.testing.assert_allclose(serial[1], pooled[1], rtol=0, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()